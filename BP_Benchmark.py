@@ -0,0 +1,173 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import BP_Generate
+####################################################################################
+#Converts graphs from BP_Generate.py at increasing sizes and records time and peak memory per size
+#Runs BP_to_CPP.py headless (headless/pyperclip.py) in a temporary directory with --profile
+#The exponent column is log(time ratio) / log(node ratio) to the previous size, ~1 is linear, 2 is quadratic
+#
+#python BP_Benchmark.py --sizes 250 500 1000 2000 --nesting 3
+####################################################################################
+
+sizes = [100, 200, 400, 800, 1600]
+repeats = 3 #Fastest run is kept
+measureMemory = True #Extra run per size under tracemalloc, kept apart so it doesn't slow down the timed runs
+outputFile = "bench_output.txt"
+
+#Phases and helpers from BP_to_CPP.py --profile shown per size
+tablePhases = ["parse", "knots", "fanOut", "traversal", "flatten", "postRegexReplacements"]
+tableCalls = ["resolveReferences", "inUse", "removeTab"]
+
+packageDir = os.path.dirname(os.path.abspath(__file__))
+converterPath = os.path.join(packageDir, "BP_to_CPP.py")
+headlessDir = os.path.join(packageDir, "headless")
+
+#Runs the script given as the first argument and prints its peak traced memory
+MEMORY_BOOTSTRAP = """import runpy, sys, tracemalloc
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+tracemalloc.start()
+try:
+    runpy.run_path(script, run_name="__main__")
+except SystemExit:
+    pass
+print("peakMemory=" + str(tracemalloc.get_traced_memory()[1]))
+"""
+
+def runConverter(workDir, graphPath, *args):
+    """Returns the completed process, args are passed to BP_to_CPP.py"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = headlessDir + os.pathsep + env.get("PYTHONPATH", "")
+    env["BP_TO_CPP_CLIPBOARD"] = graphPath
+    return subprocess.run([sys.executable] + list(args), cwd=workDir, env=env, capture_output=True, text=True)
+
+def benchmarkSize(workDir, nodeCount, generatorOptions, converterArgs):
+    graphPath = os.path.join(workDir, "Generated_" + str(nodeCount) + ".t3d")
+    with open(graphPath, "w", newline="") as f:
+        f.write(BP_Generate.generateGraph(nodeCount=nodeCount, **generatorOptions))
+    profilePath = os.path.join(workDir, "Profile_" + str(nodeCount) + ".json")
+
+    result = {"nodes" : nodeCount}
+    best = None
+    for i in range(repeats):
+        if os.path.exists(profilePath):
+            os.remove(profilePath)
+        start = time.perf_counter()
+        process = runConverter(workDir, graphPath, converterPath, "--profile", profilePath, *converterArgs)
+        wall = time.perf_counter() - start
+        if not os.path.exists(profilePath): #error() exits before the profile is written
+            result["error"] = (process.stdout + process.stderr).strip().split("\n")[-1]
+            return result
+        with open(profilePath, "r") as f:
+            profile = json.load(f)
+        if best == None or profile["seconds"] < best["seconds"]:
+            best = profile
+            best["wall"] = wall
+    result["seconds"] = best["seconds"]
+    result["wall"] = best["wall"]
+    result["phases"] = {key : phase["seconds"] for key, phase in best["phases"].items()}
+    result["calls"] = best["calls"]
+    result["graph"] = best["graph"]["parsed"]
+
+    if measureMemory:
+        process = runConverter(workDir, graphPath, "-c", MEMORY_BOOTSTRAP, converterPath, *converterArgs)
+        for line in process.stdout.split("\n"):
+            if line.startswith("peakMemory="):
+                result["peakMemory"] = int(line.split("=")[1])
+    return result
+
+def exponent(previous, current, key):
+    if previous == None or not key(previous) or not key(current):
+        return ""
+    nodeRatio = previous["graph"]["nodes"]["total"], current["graph"]["nodes"]["total"]
+    if nodeRatio[0] == nodeRatio[1]:
+        return ""
+    return "%.2f" % (math.log(key(current) / key(previous)) / math.log(nodeRatio[1] / nodeRatio[0]))
+
+def formatTable(results):
+    header = ["nodes", "pins", "edges", "seconds", "exp"] + tablePhases + tableCalls + ["peak KiB"]
+    rows = [header]
+    previous = None
+    for result in results:
+        if "error" in result:
+            rows.append([str(result["nodes"]), "error: " + result["error"]])
+            continue
+        graph = result["graph"]
+        row = [str(graph["nodes"]["total"]), str(graph["pins"]), str(graph["edges"]["total"]), "%.4f" % result["seconds"]]
+        row.append(exponent(previous, result, lambda r: r["seconds"]))
+        for phase in tablePhases:
+            row.append("%.4f" % result["phases"].get(phase, 0.0))
+        for helper in tableCalls:
+            row.append(str(result["calls"].get(helper, 0)))
+        row.append(str(result["peakMemory"] // 1024) if "peakMemory" in result else "")
+        rows.append(row)
+        previous = result
+
+    widths = [max(len(row[i]) for row in rows if i < len(row)) for i in range(len(header))]
+    lines = []
+    for row in rows:
+        lines.append("  ".join(cell.rjust(widths[i]) if i < len(widths) else cell for i, cell in enumerate(row)).rstrip())
+    return "\n".join(lines)
+
+def formatPhaseExponents(results):
+    """Growth exponent of every phase between the smallest and largest size"""
+    results = [result for result in results if not "error" in result]
+    if len(results) < 2:
+        return ""
+    lines = ["phase exponents " + str(results[0]["graph"]["nodes"]["total"]) + " -> " + str(results[-1]["graph"]["nodes"]["total"]) + " nodes:"]
+    for phase in results[-1]["phases"]:
+        value = exponent(results[0], results[-1], lambda r: r["phases"].get(phase, 0.0))
+        if value != "":
+            lines.append("  " + phase.ljust(24) + value)
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmarks BP_to_CPP.py on generated graphs of increasing size")
+    argParser.add_argument("--sizes", type=int, nargs="+", default=sizes, help="node counts to generate")
+    argParser.add_argument("--repeats", type=int, default=repeats)
+    argParser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    argParser.add_argument("--flatten", action="store_true", help="convert with flattenCode")
+    argParser.add_argument("--json", metavar="OUT", help="also write every phase and counter as JSON")
+    argParser.add_argument("--depth", type=int, default=BP_Generate.chainDepth)
+    argParser.add_argument("--fan-out", type=int, default=BP_Generate.fanOut)
+    argParser.add_argument("--knots", type=float, default=BP_Generate.knotDensity)
+    argParser.add_argument("--nesting", type=int, default=BP_Generate.nesting)
+    argParser.add_argument("--control", type=float, default=BP_Generate.controlRate)
+    argParser.add_argument("--split", type=float, default=BP_Generate.splitDensity)
+    argParser.add_argument("--seed", type=int, default=BP_Generate.seed)
+    cmdArgs = argParser.parse_args()
+    repeats = cmdArgs.repeats
+    measureMemory = not cmdArgs.no_memory
+    generatorOptions = {
+        "chainDepth" : cmdArgs.depth,
+        "fanOut" : cmdArgs.fan_out,
+        "knotDensity" : cmdArgs.knots,
+        "nesting" : cmdArgs.nesting,
+        "controlRate" : cmdArgs.control,
+        "splitDensity" : cmdArgs.split,
+        "seed" : cmdArgs.seed,
+    }
+    converterArgs = ["--flatten"] if cmdArgs.flatten else []
+
+    results = []
+    with tempfile.TemporaryDirectory() as workDir:
+        for nodeCount in cmdArgs.sizes:
+            print("Converting " + str(nodeCount) + " nodes...")
+            results.append(benchmarkSize(workDir, nodeCount, generatorOptions, converterArgs))
+
+    report = "generator " + json.dumps(generatorOptions) + (" --flatten" if cmdArgs.flatten else "") + "\n"
+    report += formatTable(results) + "\n\n" + formatPhaseExponents(results) + "\n"
+    print(report)
+    with open(outputFile, "w") as f:
+        f.write(report)
+    print("Results written to " + outputFile)
+    if cmdArgs.json:
+        with open(cmdArgs.json, "w") as f:
+            json.dump({"generator" : generatorOptions, "results" : results}, f, indent=4)
+        print("JSON written to " + cmdArgs.json)
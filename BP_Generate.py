@@ -0,0 +1,285 @@
+import argparse
+import random
+from typing import List
+####################################################################################
+#Writes synthetic UE4.27 T3D clipboard text in the form BP_to_CPP.py reads, used by BP_Benchmark.py
+#The graph is a function entry followed by blocks of variable sets, each set fed by a chain of pure math nodes
+#IfThen, Sequence and ForEachLoop nodes open nested blocks until the node budget is used up
+#
+#python BP_Generate.py --nodes 500 --nesting 3 --out Generated.t3d
+####################################################################################
+
+#Defaults, all can be changed from the command line
+nodeCount = 200 #Approximate, the last statement may go over
+chainDepth = 4 #Pure math nodes between the variable gets and a variable set
+fanOut = 1 #Variable sets reading the end of each pure chain, above 1 the chain is commented cpp:cache
+knotDensity = 0.1 #Chance that an edge is routed through a reroute knot
+nesting = 2 #Maximum depth of IfThen / Sequence / ForEachLoop blocks
+controlRate = 0.25 #Chance a statement is a control node while the nesting allows it
+splitDensity = 0.2 #Chance that a chain leaf reads a split FVector pin (Location_X) instead of a float variable
+seed = 0
+
+functionName = "GeneratedGraph"
+floatVariables = ["Speed", "Height", "Width", "Depth", "Scale", "Offset", "Weight", "Radius"]
+VECTOR = "ScriptStruct'\"/Script/CoreUObject.Vector\"'"
+ACTOR = "Class'\"/Script/Engine.Actor\"'"
+MATH_LIBRARY = "Class'\"/Script/Engine.KismetMathLibrary\"'"
+FOR_EACH_LOOP = "EdGraph'\"/Engine/EditorBlueprintResources/StandardMacros.StandardMacros:ForEachLoop\"'"
+STANDARD_MACROS = "Blueprint'\"/Engine/EditorBlueprintResources/StandardMacros.StandardMacros\"'"
+
+class GenPin():
+    def __init__(self, node, name : str, category : str, isOutput : bool) -> None:
+        self.node : GenNode = node
+        self.name : str = name
+        self.category : str = category
+        self.isOutput : bool = isOutput
+        self.id : str = ""
+        self.subCategoryObject : str = "None"
+        self.containerType : str = "None"
+        self.defaultValue : str = None
+        self.hidden : bool = False
+        self.linkedTo : List[GenPin] = []
+        self.subPins : List[GenPin] = []
+        self.parentPin : GenPin = None
+
+class GenNode():
+    def __init__(self, cls : str, name : str) -> None:
+        self.cls : str = cls #K2Node_CallFunction
+        self.name : str = name #K2Node_CallFunction_3
+        self.properties : List[str] = [] #FunctionReference=(...)
+        self.pins : List[GenPin] = []
+
+nodes : List[GenNode] = []
+classCounts = {} #class -> next node index
+pinCount = 0
+rng = random.Random(seed)
+
+def addNode(cls, *properties):
+    index = classCounts.get(cls, 0)
+    classCounts[cls] = index + 1
+    node = GenNode(cls, cls + "_" + str(index))
+    node.properties = list(properties)
+    nodes.append(node)
+    return node
+
+def addPin(node : GenNode, name, category, isOutput, *args):
+    """args[0] = default value"""
+    global pinCount
+    pin = GenPin(node, name, category, isOutput)
+    pin.id = "%032X" % pinCount
+    pinCount += 1
+    if len(args) > 0:
+        pin.defaultValue = args[0]
+    node.pins.append(pin)
+    return pin
+
+def link(output : GenPin, input : GenPin):
+    """Connects both sides like the editor does, knotDensity of the edges go through a reroute knot"""
+    if output.node.cls != "K2Node_Knot" and rng.random() < knotDensity:
+        knot = addNode("K2Node_Knot")
+        knotIn = addPin(knot, "InputPin", output.category, False)
+        knotOut = addPin(knot, "OutputPin", output.category, True)
+        knotIn.subCategoryObject = knotOut.subCategoryObject = output.subCategoryObject
+        link(output, knotIn)
+        output = knotOut
+    output.linkedTo.append(input)
+    input.linkedTo.append(output)
+
+def addSelfPin(node : GenNode):
+    pin = addPin(node, "self", "object", False)
+    pin.subCategoryObject = ACTOR
+
+def addFloatGet():
+    """Returns the output of a new float variable get, or one component of a split FVector variable get"""
+    if rng.random() < splitDensity:
+        node = addNode("K2Node_VariableGet", "VariableReference=(MemberName=\"Location\",bSelfContext=True)")
+        parent = addPin(node, "Location", "struct", True)
+        parent.subCategoryObject = VECTOR
+        parent.hidden = True
+        for axis in ["X", "Y", "Z"]:
+            sub = addPin(node, "Location_" + axis, "float", True)
+            sub.parentPin = parent
+            parent.subPins.append(sub)
+        addSelfPin(node)
+        return rng.choice(parent.subPins)
+    name = rng.choice(floatVariables)
+    node = addNode("K2Node_VariableGet", "VariableReference=(MemberName=\"" + name + "\",bSelfContext=True)")
+    pin = addPin(node, name, "float", True)
+    addSelfPin(node)
+    return pin
+
+def addMath(a : GenPin):
+    """Returns the ReturnValue of a pure math node reading a, the other operand is a variable or a literal"""
+    if rng.random() < 0.5:
+        node = addNode("K2Node_CommutativeAssociativeBinaryOperator", "bIsPureFunc=True",
+            "FunctionReference=(MemberParent=" + MATH_LIBRARY + ",MemberName=\"" + rng.choice(["Add_FloatFloat", "Multiply_FloatFloat"]) + "\")")
+    else:
+        node = addNode("K2Node_CallFunction", "bIsPureFunc=True",
+            "FunctionReference=(MemberParent=" + MATH_LIBRARY + ",MemberName=\"" + rng.choice(["Subtract_FloatFloat", "Divide_FloatFloat"]) + "\")")
+    link(a, addPin(node, "A", "float", False, "0.0"))
+    b = addPin(node, "B", "float", False, "2.0")
+    if rng.random() < 0.5:
+        link(addFloatGet(), b)
+    return addPin(node, "ReturnValue", "float", True)
+
+def addChain(*args):
+    """args[0] = pin to start the chain from instead of a variable get"""
+    if len(args) > 0 and args[0] != None:
+        value = args[0]
+    else:
+        value = addFloatGet()
+    for i in range(chainDepth):
+        value = addMath(value)
+    if fanOut > 1:
+        value.node.properties.append("NodeComment=\"cpp:cache\"")
+    return value
+
+def addSet(execPin : GenPin, value : GenPin):
+    """Returns the then pin of the new variable set"""
+    name = rng.choice(floatVariables)
+    node = addNode("K2Node_VariableSet", "VariableReference=(MemberName=\"" + name + "\",bSelfContext=True)")
+    link(execPin, addPin(node, "execute", "exec", False))
+    then = addPin(node, "then", "exec", True)
+    link(value, addPin(node, name, "float", False, "0.0"))
+    addPin(node, "Output_Get", "float", True)
+    addSelfPin(node)
+    return then
+
+def addStatements(execPin : GenPin, *args):
+    """args[0] = pin used as the first chain's start, e.g. a loop's Array Element\n
+    Returns the then pin of the last variable set"""
+    value = addChain(*args)
+    for i in range(fanOut):
+        execPin = addSet(execPin, value)
+    return execPin
+
+def addBlock(execPin : GenPin, depth, budget, *args):
+    """Adds statements after execPin until about budget nodes were added\n
+    args[0] = pin for the first chain to read"""
+    start = len(nodes)
+    first = args[0] if len(args) > 0 else None
+    while len(nodes) - start < budget:
+        remaining = budget - (len(nodes) - start)
+        if depth < nesting and remaining > 4 * (chainDepth + 2) and rng.random() < controlRate:
+            kind = rng.choice(["IfThen", "Sequence", "ForEachLoop"])
+            if kind == "ForEachLoop":
+                node = addNode("K2Node_MacroInstance", "MacroGraphReference=(MacroGraph=" + FOR_EACH_LOOP + ",GraphBlueprint=" + STANDARD_MACROS + ")")
+                link(execPin, addPin(node, "Exec", "exec", False))
+                array = addPin(node, "Array", "float", False)
+                array.containerType = "Array"
+                body = addPin(node, "LoopBody", "exec", True)
+                element = addPin(node, "Array Element", "float", True)
+                addPin(node, "Array Index", "int", True)
+                completed = addPin(node, "Completed", "exec", True)
+                getter = addNode("K2Node_VariableGet", "VariableReference=(MemberName=\"Values\",bSelfContext=True)")
+                values = addPin(getter, "Values", "float", True)
+                values.containerType = "Array"
+                addSelfPin(getter)
+                link(values, array)
+                addBlock(body, depth + 1, remaining // 2, element)
+                execPin = completed
+                continue
+            if kind == "IfThen":
+                node = addNode("K2Node_IfThenElse")
+                link(execPin, addPin(node, "execute", "exec", False))
+                condition = addPin(node, "Condition", "bool", False, "false")
+                outputs = [addPin(node, "then", "exec", True), addPin(node, "else", "exec", True)]
+                compare = addNode("K2Node_CallFunction", "bIsPureFunc=True",
+                    "FunctionReference=(MemberParent=" + MATH_LIBRARY + ",MemberName=\"Greater_FloatFloat\")")
+                link(addChain(first), addPin(compare, "A", "float", False, "0.0"))
+                first = None
+                addPin(compare, "B", "float", False, "0.5")
+                link(addPin(compare, "ReturnValue", "bool", True), condition)
+            else:
+                node = addNode("K2Node_ExecutionSequence")
+                link(execPin, addPin(node, "execute", "exec", False))
+                outputs = [addPin(node, "then_" + str(i), "exec", True) for i in range(rng.randint(2, 3))]
+            for pin in outputs:
+                addBlock(pin, depth + 1, remaining // len(outputs), first)
+                first = None
+            return
+        execPin = addStatements(execPin, first)
+        first = None
+
+def pinToT3D(pin : GenPin):
+    line = "   CustomProperties Pin (PinId=" + pin.id + ",PinName=\"" + pin.name + "\",PinType.PinCategory=\"" + pin.category + "\",PinType.PinSubCategory=\"\","
+    line += "PinType.PinSubCategoryObject=" + pin.subCategoryObject + ",PinType.PinSubCategoryMemberReference=(),PinType.PinValueType=(),"
+    line += "PinType.ContainerType=" + pin.containerType + ",PinType.bIsReference=False,PinType.bIsConst=False,PinType.bIsWeakPointer=False,PinType.bIsUObjectWrapper=False,"
+    if pin.isOutput:
+        line += "Direction=\"EGPD_Output\","
+    if pin.defaultValue != None:
+        line += "DefaultValue=\"" + pin.defaultValue + "\","
+    if pin.parentPin:
+        line += "ParentPin=" + pin.parentPin.node.name + " " + pin.parentPin.id + ","
+    if len(pin.linkedTo) > 0:
+        line += "LinkedTo=(" + "".join(other.node.name + " " + other.id + "," for other in pin.linkedTo) + "),"
+    if len(pin.subPins) > 0:
+        line += "SubPins=(" + "".join(sub.node.name + " " + sub.id + "," for sub in pin.subPins) + "),"
+    line += "PersistentGuid=00000000000000000000000000000000,bHidden=" + str(pin.hidden) + ",bNotConnectable=False,bDefaultValueIsReadOnly=False,"
+    line += "bDefaultValueIsIgnored=False,bAdvancedView=False,bOrphanedPin=False,)"
+    return line
+
+def toT3D():
+    lines = []
+    for idx, node in enumerate(nodes):
+        lines.append("Begin Object Class=/Script/BlueprintGraph." + node.cls + " Name=\"" + node.name + "\"")
+        for property in node.properties:
+            lines.append("   " + property)
+        lines.append("   NodePosX=" + str(idx * 300))
+        for pin in node.pins:
+            lines.append(pinToT3D(pin))
+        lines.append("End Object")
+    return "\r\n".join(lines) + "\r\n"
+
+def generateGraph(**options):
+    """Returns T3D text for a new graph, options override the defaults at the top, e.g. generateGraph(nodeCount=1000, nesting=3)"""
+    global nodes, classCounts, pinCount, rng
+    for key, value in options.items():
+        if not key in defaults:
+            raise KeyError("Unknown generator option " + key)
+        globals()[key] = value
+    nodes = []
+    classCounts = {}
+    pinCount = 0
+    rng = random.Random(seed)
+    entry = addNode("K2Node_FunctionEntry", "FunctionReference=(MemberName=\"" + functionName + "\")")
+    addBlock(addPin(entry, "then", "exec", True), 0, nodeCount - 1)
+    text = toT3D()
+    for key, value in defaults.items():
+        globals()[key] = value
+    return text
+
+defaults = {
+    "nodeCount" : nodeCount,
+    "chainDepth" : chainDepth,
+    "fanOut" : fanOut,
+    "knotDensity" : knotDensity,
+    "nesting" : nesting,
+    "controlRate" : controlRate,
+    "splitDensity" : splitDensity,
+    "seed" : seed,
+}
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Writes a synthetic UE4.27 blueprint graph as T3D clipboard text")
+    argParser.add_argument("--nodes", type=int, default=nodeCount, help="approximate node count")
+    argParser.add_argument("--depth", type=int, default=chainDepth, help="pure math nodes per chain")
+    argParser.add_argument("--fan-out", type=int, default=fanOut, help="variable sets reading each chain")
+    argParser.add_argument("--knots", type=float, default=knotDensity, help="chance an edge goes through a reroute knot")
+    argParser.add_argument("--nesting", type=int, default=nesting, help="maximum IfThen / Sequence / ForEachLoop depth")
+    argParser.add_argument("--control", type=float, default=controlRate, help="chance a statement is a control node")
+    argParser.add_argument("--split", type=float, default=splitDensity, help="chance a chain reads a split FVector pin")
+    argParser.add_argument("--seed", type=int, default=seed)
+    argParser.add_argument("--out", default="Generated.t3d", help="file to write, - copies to the clipboard instead")
+    cmdArgs = argParser.parse_args()
+    text = generateGraph(nodeCount=cmdArgs.nodes, chainDepth=cmdArgs.depth, fanOut=cmdArgs.fan_out, knotDensity=cmdArgs.knots,
+        nesting=cmdArgs.nesting, controlRate=cmdArgs.control, splitDensity=cmdArgs.split, seed=cmdArgs.seed)
+    if cmdArgs.out == "-":
+        import pyperclip
+        pyperclip.copy(text)
+        print("Graph copied to clipboard")
+    else:
+        with open(cmdArgs.out, "w", newline="") as f:
+            f.write(text)
+        print("Graph written to " + cmdArgs.out)
+    print(str(len(nodes)) + " nodes")
@@ -0,0 +1,139 @@
+import argparse
+import difflib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from BP_Benchmark import runConverter, converterPath
+####################################################################################
+#Converts every graph in the corpus and compares against the stored output and timing
+#corpus/Name.t3d -> exported graph, corpus/Name.cpp -> expected output.cpp, corpus/baseline.json -> Name -> seconds
+#Fails when an output differs or a conversion got slower than the baseline by more than timeThreshold
+#Runs headless through headless/pyperclip.py, each graph in its own temporary directory
+#
+#python BP_Regression.py --add MyGraph.t3d -> copies the graph into the corpus and stores its output and time
+#python BP_Regression.py --update -> accepts the current outputs and times as the new baseline
+####################################################################################
+
+corpusDir = "corpus"
+repeats = 3 #Fastest run is compared
+timeThreshold = 1.25 #Slower than baseline * timeThreshold fails
+minTimeDelta = 0.05 #Seconds, ignores noise on small graphs
+diffLines = 40 #Lines of each diff to print
+
+def convert(graphPath):
+    """Returns (output.cpp text, fastest seconds) or (error line, None)"""
+    best = None
+    output = ""
+    for i in range(repeats):
+        with tempfile.TemporaryDirectory() as workDir:
+            profilePath = os.path.join(workDir, "Profile.json")
+            process = runConverter(workDir, os.path.abspath(graphPath), converterPath, "--profile", profilePath)
+            if not os.path.exists(profilePath): #error() exits before the profile is written
+                return (process.stdout + process.stderr).strip().split("\n")[-1], None
+            with open(profilePath, "r") as f:
+                seconds = json.load(f)["seconds"]
+            with open(os.path.join(workDir, "output.cpp"), "r") as f:
+                output = f.read()
+        if best == None or seconds < best:
+            best = seconds
+    return output, best
+
+def loadBaseline():
+    path = os.path.join(corpusDir, "baseline.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def writeBaseline(baseline):
+    with open(os.path.join(corpusDir, "baseline.json"), "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+
+def getCorpus():
+    if not os.path.isdir(corpusDir):
+        return []
+    return sorted(file[:-len(".t3d")] for file in os.listdir(corpusDir) if file.endswith(".t3d"))
+
+def bless(name, baseline):
+    """Stores the current output and time of a corpus graph as expected"""
+    output, seconds = convert(os.path.join(corpusDir, name + ".t3d"))
+    if seconds == None:
+        print(name + " failed to convert, not stored: " + output)
+        return False
+    with open(os.path.join(corpusDir, name + ".cpp"), "w") as f:
+        f.write(output)
+    baseline[name] = seconds
+    print(name + " stored, %.4fs" % seconds)
+    return True
+
+def check(name, baseline):
+    """Returns a list of failure messages, empty when the graph still matches"""
+    output, seconds = convert(os.path.join(corpusDir, name + ".t3d"))
+    if seconds == None:
+        print(name.ljust(32) + "FAIL")
+        return ["conversion failed: " + output]
+    failures = []
+    goldenPath = os.path.join(corpusDir, name + ".cpp")
+    if not os.path.exists(goldenPath):
+        failures.append("no expected output, run with --update")
+    else:
+        with open(goldenPath, "r") as f:
+            golden = f.read()
+        if output != golden:
+            diff = list(difflib.unified_diff(golden.split("\n"), output.split("\n"), name + ".cpp", "output.cpp", lineterm=""))
+            failures.append("output changed:\n" + "\n".join(diff[:diffLines]) + ("\n..." if len(diff) > diffLines else ""))
+    timing = "%.4fs" % seconds
+    if name in baseline:
+        timing += " (baseline %.4fs, x%.2f)" % (baseline[name], seconds / baseline[name] if baseline[name] > 0 else 0)
+        if seconds > baseline[name] * timeThreshold and seconds - baseline[name] > minTimeDelta:
+            failures.append("slower than baseline " + timing)
+    print(name.ljust(32) + ("FAIL " if failures else "ok   ") + timing)
+    return failures
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Compares BP_to_CPP.py output and timing on the golden corpus")
+    argParser.add_argument("names", nargs="*", help="corpus graphs to run, all by default")
+    argParser.add_argument("--corpus", default=corpusDir, help="corpus directory")
+    argParser.add_argument("--add", nargs="+", metavar="T3D", help="copy exported graphs into the corpus and store their output")
+    argParser.add_argument("--update", action="store_true", help="store the current outputs and times as expected")
+    argParser.add_argument("--threshold", type=float, default=timeThreshold, help="allowed slowdown factor over the baseline")
+    argParser.add_argument("--repeats", type=int, default=repeats)
+    cmdArgs = argParser.parse_args()
+    corpusDir = cmdArgs.corpus
+    timeThreshold = cmdArgs.threshold
+    repeats = cmdArgs.repeats
+    baseline = loadBaseline()
+
+    if cmdArgs.add:
+        os.makedirs(corpusDir, exist_ok=True)
+        for path in cmdArgs.add:
+            name = os.path.splitext(os.path.basename(path))[0]
+            shutil.copyfile(path, os.path.join(corpusDir, name + ".t3d"))
+            bless(name, baseline)
+        writeBaseline(baseline)
+        sys.exit(0)
+
+    names = cmdArgs.names if cmdArgs.names else getCorpus()
+    if len(names) == 0:
+        print("No graphs in " + corpusDir + ", add some with --add")
+        sys.exit(1)
+
+    if cmdArgs.update:
+        for name in names:
+            bless(name, baseline)
+        writeBaseline(baseline)
+        sys.exit(0)
+
+    failed = {}
+    for name in names:
+        failures = check(name, baseline)
+        if failures:
+            failed[name] = failures
+    for name, failures in failed.items():
+        print("\n" + name + ":")
+        for failure in failures:
+            print(failure)
+    print("\n" + str(len(names) - len(failed)) + "/" + str(len(names)) + " passed")
+    sys.exit(1 if failed else 0)
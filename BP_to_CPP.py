@@ -1,17 +1,28 @@
 import pyperclip
-import pathlib
 import re
 import traceback
+import hashlib
+import json
+import os
+import time
+import argparse
+import tempfile
+from contextlib import contextmanager
+from collections import deque
 from typing import List
 ####################################################################################
 #Designed for copying a single node graph from UE4.27 to the clipboard
 #Will create functions for macros
-#Problems with compiling goto statements can be fixed by not having multiple execute inputs into a single node, use sequences and macros to avoid it
+#Nodes with multiple execute inputs are emitted once as a lambda (auto tail0 = [&]() {...};) declared where the paths split, execs looping back become a label and goto
 
 #Use these as comments on nodes:
 #cpp:ignore -> Ignores the node, useful for reducing code from return nodes in macros
 #cpp:local -> Use on setting a variable to transform from this->var = 0; to float var = 0;
 #cpp:cache -> Use to supress warning about pure function being connected to multiple nodes
+#cpp:trace -> Records trace events for the node and the pure nodes it resolves, written to BP_to_CPP_Trace.json
+
+#Macro graphs: put Library:MacroName (e.g. W4_Macros_Object:FloatCurve) on the first line of the input tunnel's comment,
+#the converted function is cached in macroCacheDir and calls to that macro from other graphs use it
 ####################################################################################
 
 #What category to set in UPROPERTY for this-> variables at the top
@@ -24,12 +35,45 @@ className = "AW4Database_Funcs"
 #Can also be overridden by adding a comment to the first line of the start node of your bp graph
 functionName = "ScannerTick" 
 
+#Writes the function to outputDir/className/functionName.cpp instead of output.cpp and the clipboard, also --output-dir
+#Files that already have the same content aren't rewritten so their timestamps don't trigger an Unreal rebuild
+outputDir = ""
+
+#With outputDir, groups the functions of each className into unity files of up to unitySize functions, 0 off, also --unity N
+#Functions are written as functionName.inl and included by className_UnityN.cpp, their #include lines are merged at the top of the unity file
+#A function keeps its unity file once assigned (DIR/className/unity.json) so adding one only changes the unity file it goes into
+unitySize = 0
+
 #Used for directly adding variables inline, if the variable is only declared and used once
 flattenCode = False
 
-debug = False
+#Folds math on literal pins, e.g. |FVector(0,0,100) * 2.0| -> |FVector(0,0,200)|, and drops identities like |A * 1|, |A + 0|, |A && true|
+constantFolding = True
+
+#Lowers Select nodes with non-trivial option chains to a switch so only the selected option is evaluated, literal options keep the inline ternary
+lazySelect = True
+
+#Collapses chains of single use Append (Concat_StrStr) nodes into one FString::Printf or one reserved FString instead of |a + b + c + d|
+batchStringConcat = True
+
+#Removes nodes that can't be reached from the start node (exec outputs and pure inputs) before converting, reportPruned prints them
+pruneUnreachable = True
+reportPruned = False
+
+#Converted macro graphs are stored here with a content hash, unchanged macros are reused and callers call the cached function, empty to disable
+#Macros.cpp in this directory has every cached macro function once
+macroCacheDir = "BP_to_CPP_Macros"
+
+#Trace events (node, type, handler, emitted line range, duration) kept in a ring buffer, 0 off, 1 exec nodes, 2 also the pure nodes they resolve
+#--trace [OUT] writes them as JSON or with --trace-format chrome for chrome://tracing / Perfetto
+traceLevel = 0
+traceBufferSize = 100000 #Only the newest events are kept
 errorTrace = False
 
+#Records every problem and keeps converting instead of stopping at the first one, also --keep-going
+#A node that can't be converted becomes a // BP_to_CPP: comment and nodes using its outputs are skipped, everything is reported at the end with exit code 1
+collectErrors = False
+
 #Texts to global replace, called on cpp afterwards
 postReplacements = {
     "UW4_InGame_TextBP_C" : "AW4_InGame_Text",
@@ -108,7 +152,7 @@ Structs = {
     "FVector2D" : ["FVector2D(", ")"],
 }
 
-#Code specifically checks for a " = " in [1] for adding |type x = y|
+#A " = " in [1] makes [0] the output pin, |type x = y|, each entry is compiled once into a FunctionFormat when the tables are loaded
 functionFormat = { #Pin, Operand, Pin, Operand, Pin, Operand, Pin, Operand, ...
     "Multiply_VectorFloat" : ["ReturnValue", " = (", "A", " * ", "B", ")"],
     "Multiply_VectorInt" : ["ReturnValue", " = (", "A", " * ", "B", ")"],
@@ -134,7 +178,6 @@ functionFormat = { #Pin, Operand, Pin, Operand, Pin, Operand, Pin, Operand, ...
     "EqualEqual_FloatFloat" : ["ReturnValue", " = (", "A", " == ", "B", ")"],
     "EqualEqual_IntInt" : ["ReturnValue", " = (", "A", " == ", "B", ")"],
     "Not_PreBool" : ["ReturnValue", " = !(", "A", ")"],
-    "Map_Find" : ["Value", " = ", "TargetMap", "[", "Key", "]"],
     "Map_Keys" : ["TargetMap", ".GetKeys(", "Keys", ")"],
     "Map_Clear" : ["TargetMap", ".Reset()"],
     "Array_Length" : ["ReturnValue", " = ", "TargetArray", ".Num()"],
@@ -180,6 +223,81 @@ VariableGetsToFunctions = {
     "APlayerCameraManager TransformComponent" : "GetTransformComponent()",
 }
 
+#Header of each type and library the converted code can use, only the headers of what it actually uses become #include lines, see emitIncludes
+#Types are looked up after postReplacements, library calls as both the memberParentsToUse name and U + MemberParent (UKismetMathLibrary)
+includeHeaders = {
+    "FVector" : "CoreMinimal.h",
+    "FRotator" : "CoreMinimal.h",
+    "FTransform" : "CoreMinimal.h",
+    "FLinearColor" : "CoreMinimal.h",
+    "FIntVector" : "CoreMinimal.h",
+    "FVector2D" : "CoreMinimal.h",
+    "FString" : "CoreMinimal.h",
+    "FName" : "CoreMinimal.h",
+    "FText" : "CoreMinimal.h",
+    "FHitResult" : "Engine/EngineTypes.h",
+    "AActor" : "GameFramework/Actor.h",
+    "APlayerCameraManager" : "Camera/PlayerCameraManager.h",
+    "USceneComponent" : "Components/SceneComponent.h",
+    "UStaticMeshComponent" : "Components/StaticMeshComponent.h",
+    "UStaticMesh" : "Engine/StaticMesh.h",
+    "UMaterialInstanceDynamic" : "Materials/MaterialInstanceDynamic.h",
+    "UCurveFloat" : "Curves/CurveFloat.h",
+    "UCurveVector" : "Curves/CurveVector.h",
+    "UKismetSystemLibrary" : "Kismet/KismetSystemLibrary.h",
+    "UKismetMathLibrary" : "Kismet/KismetMathLibrary.h",
+    "UBlueprintMapLibrary" : "Kismet/BlueprintMapLibrary.h",
+    "UKismetMaterialLibrary" : "Kismet/KismetMaterialLibrary.h",
+    "UGameplayStatics" : "Kismet/GameplayStatics.h",
+    "UKismetTextLibrary" : "Kismet/KismetTextLibrary.h",
+    "UKismetStringLibrary" : "Kismet/KismetStringLibrary.h",
+}
+
+#Adds the #include lines of includeHeaders to the --output-dir files, merged at the top of the unity file with --unity
+#The clipboard and output.cpp are pasted into an existing file, their includes are printed instead
+emitIncludes = True
+
+#Per-project tables, a JSON object with any of the tables above by name, also --tables
+#Entries are added to the defaults above, an entry set to null removes the default, actorTypes and componentTypes are lists
+#e.g. {"memberParentsToUse" : {"MyProject_Funcs" : "MyFuncs"}, "postReplacements" : {"UW4_InGame_Text" : null}}
+tablesFile = "BP_to_CPP_Tables.json"
+
+#--watch converts every graph copied to the clipboard, checked every watchInterval seconds, the tables are only reloaded when a file changes
+watchInterval = 0.5
+
+#Command line options, e.g. |python BP_to_CPP.py --profile|
+argParser = argparse.ArgumentParser(description="Converts a UE4.27 blueprint graph on the clipboard to C++")
+argParser.add_argument("--profile", nargs="?", const="BP_to_CPP_Profile.json", metavar="OUT",
+    help="write wall time and helper call counts per phase and the graph sizes to a JSON file (default BP_to_CPP_Profile.json)")
+argParser.add_argument("--output-dir", metavar="DIR", help="write to DIR/className/functionName.cpp instead of output.cpp and the clipboard")
+argParser.add_argument("--unity", type=int, default=0, metavar="N", help="with --output-dir, group the functions of a class into unity files of N functions")
+argParser.add_argument("--flatten", action="store_true", help="same as flattenCode = True")
+argParser.add_argument("--coverage", nargs="+", metavar="PATH", help="parse exported graphs (files or directories) without converting and rank what the converter has no handler or table entry for")
+argParser.add_argument("--tables", metavar="JSON", help="per-project tables file (default " + tablesFile + " if it exists)")
+argParser.add_argument("--watch", action="store_true", help="keep running and convert every graph copied to the clipboard")
+argParser.add_argument("--keep-going", action="store_true", help="same as collectErrors = True, report every problem instead of stopping at the first")
+argParser.add_argument("--cprofile", metavar="OUT", help="run the conversion under cProfile, write the stats to OUT (.prof) and print the slowest converter functions")
+argParser.add_argument("--tracemalloc", action="store_true", help="trace allocations during the conversion and print the peak and the top allocating converter functions and lines")
+argParser.add_argument("--top", type=int, default=15, metavar="N", help="entries in the --cprofile and --tracemalloc summaries (default 15)")
+argParser.add_argument("--trace", nargs="?", const="BP_to_CPP_Trace.json", metavar="OUT", help="record trace events and write them to OUT (default BP_to_CPP_Trace.json)")
+argParser.add_argument("--trace-level", type=int, default=2, choices=[1, 2], help="1 exec nodes, 2 also pure nodes (default 2)")
+argParser.add_argument("--trace-format", default="json", choices=["json", "chrome"], help="chrome writes the trace event format for chrome://tracing and Perfetto")
+cmdArgs = argParser.parse_args()
+if cmdArgs.output_dir:
+    outputDir = cmdArgs.output_dir
+if cmdArgs.unity > 0:
+    unitySize = cmdArgs.unity
+if unitySize > 0 and outputDir == "":
+    argParser.error("unitySize / --unity needs outputDir / --output-dir")
+if cmdArgs.flatten:
+    flattenCode = True
+if cmdArgs.trace:
+    traceLevel = cmdArgs.trace_level
+if cmdArgs.keep_going:
+    collectErrors = True
+if cmdArgs.tables:
+    tablesFile = cmdArgs.tables
+
 class Variable():
     def __init__(self) -> None:
         self.name : str = ""
@@ -188,29 +306,12 @@ class Variable():
 
 vars : dict[str : list[str]]= {} #var -> [var, operator, var, operator, ...]
 pinsToVariables : dict[str : Variable] = {} #node.name pinId -> [variable name, tab]
+mapFinds : dict[str : Variable] = {} #map var key var -> [Find() pointer variable name, tab]
 cpp = ""
 currentTab = 0
 
-def findPersistentOption(option):
-    global persistent
-    return persistent[persistent.find(option) :].split("=")[1].split(",")[0]
-
-def writeToPersistent(new):
-    f = open("BP_to_CPP_Persistent.txt", "w")
-    f.write(new)
-    f.close()
-
-persistent = ""
-f = open("BP_to_CPP_Persistent.txt", "r")
-if f.readable():
-    persistent = f.read()
-    f.close()
-else:
-    f.close()
-    writeToPersistent("currentVarInc=0")
-
 #Will be used to generate variables like var0, branch0, skip0
-# currentVarInc = int(findPersistentOption("currentVarInc"))
+#Starts at 0 for every conversion and counts in node order, an unchanged graph always gets the same names, nothing is kept between runs
 currentVarInc = 0
 
 primitives = {"int", "float", "bool"}
@@ -236,6 +337,7 @@ FunctionResult = 16
 FunctionEntry = 17
 BreakStruct = 18
 Select = 19
+Unsupported = 20 #Unknown node class, only kept with collectErrors
 
 #Array Function Types:
 ArraySet = 1
@@ -247,6 +349,9 @@ class PinConnection():
     def __init__(self):
         self.nodeName : str = ""
         self.PinId : str = ""
+        self.isBackEdge : bool = False #Exec connection that loops back to a node dominating it, emitted as a goto
+        self.isTailBody : bool = False #Stack entry that emits the body of a shared tail lambda instead of calling it
+        self.jump : str = "" #goto, return or tail call emitted for back edges and tail calls
 
 class Pin():
     def __init__(self):
@@ -268,6 +373,7 @@ class Pin():
         self.Enum : str = ""
         self.node : Node = None
         self.ParentPin : Pin = None
+        self.Type : PinType = None #Interned by getPinType, the fields above don't change once the pin is parsed
 
     def connected(self):
         for con in self.connections:
@@ -288,11 +394,7 @@ class Pin():
             return getOutPinToVariable(self)
     
     def isSubPin(self):
-        for pin in self.node.pins:
-            for subPin in pin.SubPins:
-                if subPin.PinId == self.PinId:
-                    return True
-        return False
+        return self.ParentPin != None
     
     def inUse(self):
         for node in nodes.values():
@@ -312,20 +414,28 @@ class Pin():
     def getSubName(self):
         if not self.isSubPin():
             error("Attempting to get subname from non-subpin! " + self.PinName)
+        prefix = self.ParentPin.PinName + "_"
+        if self.PinName.startswith(prefix): #ReturnValue_Rotation_Roll -> Roll
+            name = self.PinName[len(prefix) : ]
+        else:
+            index = len(self.PinName) - self.PinName[::-1].find("_") #Find index in reversed string, then find inverse index
+            name = self.PinName[index : ]
         if self.ParentPin.type in SubPinGetters:
             getters = SubPinGetters[self.ParentPin.type]
+            if name in getters:
+                return getters[name]
             for key, val in getters.items():
-                if self.PinName.find(key) != -1:
+                if name.find(key) != -1:
                     return val
-                
-        index = len(self.PinName) - self.PinName[::-1].find("_") #Find index in reversed string, then find inverse index
-        return self.PinName[index : ]
+        return name
     
     def hasSubPins(self):
         return not isEmpty(self.SubPins)
     
     #Intended for finding how many different nodes connected to
     def numUniqueNodeConnections(self):
+        if self.node and self.node.Name in fanOutTable and self.PinId in fanOutTable[self.node.Name].uniqueConsumers:
+            return fanOutTable[self.node.Name].uniqueConsumers[self.PinId]
         keys = set()
         for con in self.connections:
             keys.add(con.nodeName)
@@ -338,6 +448,7 @@ class Node():
     def __init__(self):
         self.type : int = 0
         self.Name : str = ""
+        self.Class : str = "" #K2Node_CallFunction
         self.pins : List[Pin] = []
         self.subPins : List[Pin] = []
         self.macroType : int = 0
@@ -345,20 +456,25 @@ class Node():
         self.MemberParent : str = "" #KismetMathLibrary
         self.MemberName : str = "" #InvertTransform
         self.postCode : str = "" #Used for adding labelX {
-        self.prefixCode : str = "" #Used for adding labelX {
         self.MacroGraph : str = "" #StandardMacros:ForEachLoop
         self.ResolvedWildcardType : str = "" #StaticMeshComponent
         self.breakVar : str = "" #break0 | Used for for loops with break
         self.NodeComment : str = ""
         self.LocalVariables : List[Pin] = []
+        self.mapFinds : dict[str : Variable] = None #Unindent only | Find() pointers to restore for else branches
+        self.preCode : str = "" #Unindent only | return 0; of a shared tail lambda
 
     def hasInputExec(self):
+        if self.Name in fanOutTable:
+            return fanOutTable[self.Name].execIn > 0
         for pin in self.pins:
             if pin.isExec and pin.isInput and len(pin.connections) != 0:
                 return True
         return False
     
     def hasOutputExec(self):
+        if self.Name in fanOutTable:
+            return fanOutTable[self.Name].execOut > 0
         for pin in self.pins:
             if pin.isExec and pin.isOutput and len(pin.connections) != 0:
                 return True
@@ -366,6 +482,8 @@ class Node():
 
     #Says if the node belongs to the class we're working in, does not require resolving references
     def selfIsContext(self):
+        if self.Name in fanOutTable:
+            return fanOutTable[self.Name].selfIsContext
         if not self.getSelfInput():
             return True
         for pin in self.pins:
@@ -432,6 +550,35 @@ class Node():
         error("Could not find pin on node! " + self.Name + " | " + id)
         return None
 
+class FanOut():
+    def __init__(self) -> None:
+        self.execIn : int = 0 #Number of exec connections entering the node
+        self.execOut : int = 0
+        self.selfIsContext : bool = True
+        self.uniqueConsumers : dict[str : int] = {} #Output pinId -> number of different nodes connected to it and its subpins
+
+fanOutTable : dict[str : FanOut] = {} #node.Name -> FanOut, filled before the start node search and again once connections are final, so node and pin checks don't rescan pins
+
+def addFanOut(node : Node):
+    fanOut = FanOut()
+    for pin in node.pins:
+        if pin.isExec:
+            if pin.isInput:
+                fanOut.execIn += len(pin.connections)
+            else:
+                fanOut.execOut += len(pin.connections)
+        elif pin.isInput and pin.PinName == "self" and len(pin.connections) != 0:
+            fanOut.selfIsContext = False
+        if pin.isOutput:
+            consumers = set()
+            for con in pin.connections:
+                consumers.add(con.nodeName)
+            for subPin in pin.SubPins:
+                for con in subPin.connections:
+                    consumers.add(con.nodeName)
+            fanOut.uniqueConsumers[pin.PinId] = len(consumers)
+    fanOutTable[node.Name] = fanOut
+
 def getDefaultValue(pin : Pin):
     if line.find("DefaultValue=") != -1:
         struct = None
@@ -440,51 +587,117 @@ def getDefaultValue(pin : Pin):
             pin.DefaultValue = struct[0] + cleanBP(lFind4("DefaultValue")) + struct[1]
         else:
             pin.DefaultValue = cleanBP(lFind4("DefaultValue"))
-    elif pin.ContainerType == "Array" or pin.ContainerType == "Set" or pin.ContainerType == "Map":
-        pin.DefaultValue = "{}"
     else:
-        if pin.type == "FTransform":
-            pin.DefaultValue = "FTransform::Identity"
-        if pin.type == "FVector":
-            pin.DefaultValue = "FVector::ZeroVector"
-        if pin.type == "FIntVector":
-            pin.DefaultValue = "FIntVector::ZeroValue"
-        if pin.type == "FVector2D":
-            pin.DefaultValue = "FVector2D::ZeroVector"
-        if pin.type == "FRotator":
-            pin.DefaultValue = "FRotator::ZeroRotator"
-        if pin.type == "float" or pin.type == "int":
-            pin.DefaultValue = "0"
-        if pin.type == "bool":
-            pin.DefaultValue = "false"
+        pin.DefaultValue = getPinType(pin).DefaultValue
+
+class PinType():
+    def __init__(self) -> None:
+        self.spelling : str = "" #|TArray<UStaticMeshComponent*> |, with the trailing space typ() always had
+        self.inParameter : str = "" #|const FVector& |, pointers are passed as is
+        self.outParameter : str = "" #|FVector& |
+        self.DefaultValue : str = "" #Used when the pin has no DefaultValue, |FVector::ZeroVector|, |{}| for containers
+        self.names : List[str] = [] #Types the spelling uses, for includeHeaders
+
+pinTypes : dict[tuple : PinType] = {} #(type, isPointer, ContainerType, TerminalCategory, isTerminalPointer) -> PinType
+usedTypes = set() #Types and libraries in the output, see getIncludes
+objectTypes : dict[tuple : str] = {} #(category, PinSubCategoryObject) -> C++ type
+typeDefaults = {
+    "FTransform" : "FTransform::Identity",
+    "FVector" : "FVector::ZeroVector",
+    "FIntVector" : "FIntVector::ZeroValue",
+    "FVector2D" : "FVector2D::ZeroVector",
+    "FRotator" : "FRotator::ZeroRotator",
+    "float" : "0",
+    "int" : "0",
+    "bool" : "false",
+}
+
+def newPinType(pin : Pin):
+    pinType = PinType()
+    name = pin.type + ("*" if pin.isPointer else "")
+    if pin.ContainerType == "Array" or pin.ContainerType == "Set":
+        pinType.spelling = "T" + pin.ContainerType + "<" + name + "> "
+    elif pin.ContainerType == "Map":
+        pinType.spelling = "TMap<" + name + ", " + pin.TerminalCategory + ("*" if pin.isTerminalPointer else "") + "> "
+    else:
+        pinType.spelling = name + " "
+    if pin.isPointer:
+        pinType.inParameter = pinType.spelling
+        pinType.outParameter = pinType.spelling
+    else:
+        pinType.inParameter = "const " + pinType.spelling + "& "
+        pinType.outParameter = pinType.spelling + "& "
+    if pin.ContainerType == "Array" or pin.ContainerType == "Set" or pin.ContainerType == "Map":
+        pinType.DefaultValue = "{}"
+    elif pin.type in typeDefaults:
+        pinType.DefaultValue = typeDefaults[pin.type]
+    pinType.names = [pin.type]
+    if pin.ContainerType == "Map":
+        pinType.names.append(pin.TerminalCategory)
+    return pinType
+
+def getPinType(pin : Pin) -> PinType:
+    """Shared type entry of the pin, built once per distinct type"""
+    if pin.Type == None:
+        key = (pin.type, pin.isPointer, pin.ContainerType, pin.TerminalCategory, pin.isTerminalPointer)
+        if not key in pinTypes:
+            pinTypes[key] = newPinType(pin)
+        pin.Type = pinTypes[key]
+    return pin.Type
+
+def usePinType(pin : Pin) -> PinType:
+    """getPinType for a type written to the output"""
+    pinType = getPinType(pin)
+    usedTypes.update(pinType.names)
+    return pinType
+
+def getIncludes():
+    """#include lines for the used types and libraries in includeHeaders, sorted"""
+    headers = set()
+    for name in usedTypes:
+        for key in postReplacements:
+            name = name.replace(key, postReplacements[key])
+        if name in includeHeaders:
+            headers.add(includeHeaders[name])
+    return ["#include \"" + header + "\"" for header in sorted(headers)]
 
 startNode : Node = None
 endNode : Node = None
 
-#Return FName for name, FString for string, etc.
-def getTypeFromBP(bptype, objectTypeKeyword): 
-    if bptype == "exec":
-        return "exec"
-    elif bptype == "object" and objectTypeKeyword:
-        t = cleanBP(getDotSeparatedName(lFind(objectTypeKeyword)))
+def getObjectType(bptype, path):
+    """C++ type of an object, struct or enum path, e.g. /Script/Engine.StaticMeshComponent -> UStaticMeshComponent, worked out once per path"""
+    key = (bptype, path)
+    if key in objectTypes:
+        return objectTypes[key]
+    if bptype == "object":
+        t = cleanBP(getDotSeparatedName(path))
         if t in actorTypes:
-            return "A" + t
+            t = "A" + t
         elif t in componentTypes:
-            return "U" + t
+            t = "U" + t
         elif t.lower().find("component") != -1:
-            return "U" + t
+            t = "U" + t
         elif t.lower().find("actor") != -1:
-            return "A" + t
+            t = "A" + t
         else:
-            return "U" + t
-    elif bptype == "struct" and objectTypeKeyword:
-        return "F" + cleanBP(lFind(objectTypeKeyword).split(".")[1])
+            t = "U" + t
+    elif bptype == "struct":
+        t = "F" + cleanBP(path.split(".")[1])
+    else:
+        t = cleanBP(path.split(".")[1])
+    objectTypes[key] = t
+    return t
+
+#Return FName for name, FString for string, etc.
+def getTypeFromBP(bptype, objectTypeKeyword): 
+    if bptype == "exec":
+        return "exec"
+    elif (bptype == "object" or bptype == "struct" or bptype == "byte") and objectTypeKeyword:
+        return getObjectType(bptype, lFind(objectTypeKeyword))
     elif bptype == "name":
         return "FName"
     elif bptype == "string":
         return "FString"
-    elif bptype == "byte" and objectTypeKeyword:
-        return cleanBP(lFind(objectTypeKeyword).split(".")[1])
     elif bptype == "interface":
         return "auto"
     elif bptype == "class":
@@ -494,6 +707,9 @@ def getTypeFromBP(bptype, objectTypeKeyword):
     elif bptype in primitives:
         return bptype #int, float, bool, etc.
     else:
+        if collectErrors:
+            addDiagnostic(n, "Unknown pin category! " + bptype)
+            return "auto"
         error("Unknown pin category! " + bptype + "\n" + line)
 
 def easyMacroCall(node : Node):
@@ -519,7 +735,16 @@ def easyMacroCall(node : Node):
         code += typ(pin) + getOutPinToVariable(pin) + "; "
     if not isEmpty(resultPins):
         code += "\n"
-    code += tabs() + node.MacroGraph + "("
+    macroFunction = node.MacroGraph
+    if macroCacheDir != "":
+        cached = findCachedMacro(node.MacroGraph)
+        if cached:
+            macroFunction = cached["function"]
+            owner = cached.get("class", className)
+            if owner != className: #Converted as part of another class, declare it static there
+                macroFunction = owner + "::" + macroFunction
+            macroHelpersUsed.add(node.MacroGraph)
+    code += tabs() + macroFunction + "("
     for pin in paramPins:
         code += getInPinToVariable(pin) + ", "
     for pin in resultPins:
@@ -529,7 +754,517 @@ def easyMacroCall(node : Node):
         addNodeToStack(outPin.con())
     return code + suffix
 
+macroCache = None #Macro path -> {"hash", "function", "file"}, loaded once from macroCacheDir
+macroHelpersUsed = set()
+
+def loadMacroCache():
+    global macroCache
+    if macroCache != None:
+        return macroCache
+    macroCache = {}
+    if macroCacheDir != "" and os.path.isfile(os.path.join(macroCacheDir, "index.json")):
+        with open(os.path.join(macroCacheDir, "index.json"), "r") as f:
+            macroCache = json.load(f)
+    return macroCache
+
+def getGraphHash(content):
+    """Hash of the clipboard graph and the converter, node positions and guids don't change the output"""
+    sha = hashlib.sha1()
+    with open(__file__, "rb") as f:
+        sha.update(f.read())
+    sha.update(tablesDigest.encode("utf-8"))
+    options = [className, flattenCode, collectErrors, constantFolding, lazySelect, batchStringConcat, pruneUnreachable, emitIncludes] #Settings that change the output
+    sha.update(json.dumps(options).encode("utf-8"))
+    for line in content.split("\r\n"):
+        stripped = line.strip()
+        if stripped.startswith("NodePos") or stripped.startswith("NodeGuid") or stripped.startswith("NodeWidth") or stripped.startswith("NodeHeight"):
+            continue
+        sha.update(stripped.encode("utf-8"))
+    return sha.hexdigest()
+
+def findCachedMacro(macroGraph):
+    """Returns the cache entry for a macro path like W4_Macros_Object:FloatCurve, or None"""
+    cache = loadMacroCache()
+    if macroGraph in cache:
+        return cache[macroGraph]
+    return None
+
+def findCachedMacroByHash(hash):
+    cache = loadMacroCache()
+    for macroPath, entry in cache.items():
+        if entry["hash"] == hash and os.path.isfile(os.path.join(macroCacheDir, entry["file"])):
+            return entry
+    return None
+
+def getFileMode(path):
+    """Permissions path has, or the ones open() would give a new file"""
+    if os.path.exists(path):
+        return os.stat(path).st_mode & 0o777
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def writeAtomic(path, text):
+    """Writes to a temporary file next to path and renames it over path, readers never see a partly written file"""
+    handle, tempPath = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as f:
+            f.write(text)
+        os.chmod(tempPath, getFileMode(path)) #mkstemp creates the file owner-only
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+@contextmanager
+def fileLock(path):
+    """Holds an exclusive lock on path, for files that conversions running in parallel update"""
+    with open(path, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def storeMacro(macroPath, hash, function, code):
+    """Writes the converted macro to macroCacheDir and rebuilds Macros.cpp so every macro function is in it once\n
+    The index is read again under the lock so macros stored by other runs in the meantime are kept"""
+    global macroCache
+    os.makedirs(macroCacheDir, exist_ok=True)
+    with fileLock(os.path.join(macroCacheDir, "index.lock")):
+        macroCache = None
+        cache = loadMacroCache()
+        file = re.sub(r"[^\w]", "_", macroPath) + ".cpp"
+        writeAtomic(os.path.join(macroCacheDir, file), code)
+        cache[macroPath] = {"hash" : hash, "function" : function, "class" : className, "file" : file}
+        writeAtomic(os.path.join(macroCacheDir, "index.json"), json.dumps(cache, indent=4, sort_keys=True))
+        macros = ""
+        includes = []
+        for key in sorted(cache.keys()):
+            path = os.path.join(macroCacheDir, cache[key]["file"])
+            if os.path.isfile(path):
+                with open(path, "r") as f:
+                    macroIncludes, body = splitIncludes(f.read())
+                includes += [include for include in macroIncludes if not include in includes]
+                macros += "//" + key + "\n" + body + "\n"
+        if len(includes) > 0:
+            macros = "\n".join(sorted(includes)) + "\n\n" + macros
+        writeAtomic(os.path.join(macroCacheDir, "Macros.cpp"), macros)
+
+def writeIfChanged(path, text):
+    """Writes text to path unless the file already has exactly that content, returns True if it was written"""
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    if os.path.dirname(path) != "":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    writeAtomic(path, text)
+    return True
+
+def getOutputPath():
+    if outputDir == "":
+        return "output.cpp"
+    return os.path.join(outputDir, re.sub(r"[^\w]", "_", className), re.sub(r"[^\w]", "_", functionName) + (".inl" if unitySize > 0 else ".cpp"))
+
+def splitIncludes(code):
+    """Returns the leading #include lines and the rest of the code"""
+    lines = code.split("\n")
+    i = 0
+    while i < len(lines) and (lines[i].startswith("#include") or lines[i].strip() == ""):
+        i += 1
+    return [line for line in lines[:i] if line != ""], "\n".join(lines[i:])
+
+def writeUnityFiles(path, includes):
+    """Adds the function at path to a unity file of its class and rewrites the unity files that changed\n
+    includes = None removes the function at path from its unity file and deletes it"""
+    classDir = os.path.dirname(path)
+    function = os.path.basename(path)
+    with fileLock(os.path.join(classDir, "unity.lock")):
+        if includes == None and os.path.isfile(path):
+            os.remove(path)
+        manifestPath = os.path.join(classDir, "unity.json")
+        manifest = {} #function file -> {"unit", "includes"}
+        if os.path.isfile(manifestPath):
+            with open(manifestPath, "r") as f:
+                manifest = json.load(f)
+        manifest = {key : entry for key, entry in manifest.items() if os.path.isfile(os.path.join(classDir, key))}
+        if includes != None:
+            if not function in manifest:
+                sizes = {}
+                for entry in manifest.values():
+                    sizes[entry["unit"]] = sizes.get(entry["unit"], 0) + 1
+                unit = 0
+                while sizes.get(unit, 0) >= unitySize:
+                    unit += 1
+                manifest[function] = {"unit" : unit}
+            manifest[function]["includes"] = includes
+        if len(manifest) > 0:
+            writeIfChanged(manifestPath, json.dumps(manifest, indent=4, sort_keys=True))
+        elif os.path.isfile(manifestPath):
+            os.remove(manifestPath)
+
+        units = {}
+        for key in sorted(manifest.keys()):
+            units.setdefault(manifest[key]["unit"], []).append(key)
+        name = os.path.basename(classDir)
+        for unit, functions in units.items():
+            unitIncludes = []
+            for key in functions:
+                for include in manifest[key]["includes"]:
+                    if not include in unitIncludes:
+                        unitIncludes.append(include)
+            code = "// Unity file for " + name + ", generated by BP_to_CPP.py\n"
+            if len(unitIncludes) > 0:
+                code += "\n".join(sorted(unitIncludes)) + "\n"
+            code += "\n" + "".join("#include \"" + key + "\"\n" for key in functions)
+            writeIfChanged(os.path.join(classDir, name + "_Unity" + str(unit) + ".cpp"), code)
+        for file in os.listdir(classDir): #Unity files left empty by removed functions
+            match = re.fullmatch(re.escape(name) + r"_Unity(\d+)\.cpp", file)
+            if match and not int(match.group(1)) in units:
+                os.remove(os.path.join(classDir, file))
+
+def writeOutput(code):
+    path = getOutputPath()
+    if unitySize > 0:
+        includes, body = splitIncludes(code)
+        written = writeIfChanged(path, body)
+        writeUnityFiles(path, includes)
+        separate = path[: -len(".inl")] + ".cpp" #Left from a run without --unity, would be compiled twice
+        if os.path.isfile(separate):
+            os.remove(separate)
+    else:
+        written = writeIfChanged(path, code)
+        inline = path[: -len(".cpp")] + ".inl" #Left from a run with --unity, its unity file would define the function twice
+        if outputDir != "" and os.path.isfile(inline):
+            writeUnityFiles(inline, None)
+
+    if outputDir == "":
+        pyperclip.copy(code)
+        print("Output copied to clipboard")
+    print("Output written to:" if written else "Output unchanged, not written:")
+    print(os.path.abspath(path))
+
+    code = re.sub(r"// BP_to_CPP: skipped [^\n]*", "", code) #collectErrors placeholders name K2Node_ nodes
+    k2Index = code.lower().find("k2")
+    if k2Index != -1:
+        print("K2 found! " + code[k2Index : k2Index + 40 ])
+
+#Only used with --profile, the hot helpers are wrapped with counters before the clipboard is read so they cost nothing otherwise
+profilePhases = {} #phase -> {"seconds", "runs", "calls" : {helper -> count}}
+profileCalls = {} #helper -> count
+graphSizes = {} #"parsed" / "converted" -> {"nodes", "pins", "edges"}
+currentPhase = ""
+phaseStart = 0.0
+phaseCalls = {}
+
+def countCalls(name, function):
+    def counted(*params, **kwparams):
+        profileCalls[name] = profileCalls.get(name, 0) + 1
+        return function(*params, **kwparams)
+    return counted
+
+def startPhase(name):
+    """Ends the running phase and starts timing the next, an empty name only ends it"""
+    global currentPhase, phaseStart, phaseCalls
+    if not cmdArgs.profile:
+        return
+    now = time.perf_counter()
+    if currentPhase != "":
+        phase = profilePhases.setdefault(currentPhase, {"seconds" : 0.0, "runs" : 0, "calls" : {}})
+        phase["seconds"] += now - phaseStart
+        phase["runs"] += 1
+        for helper, count in profileCalls.items():
+            if count != phaseCalls.get(helper, 0):
+                phase["calls"][helper] = phase["calls"].get(helper, 0) + count - phaseCalls.get(helper, 0)
+    currentPhase = name
+    phaseStart = now
+    phaseCalls = dict(profileCalls)
+
+def countGraph(key):
+    """Records node counts by class, pin count and edge counts by pin type\n
+    Edges are counted from their output pin"""
+    if not cmdArgs.profile:
+        return
+    sizes = {"nodes" : {}, "pins" : 0, "edges" : {}}
+    for node in nodes.values():
+        sizes["nodes"][node.Class] = sizes["nodes"].get(node.Class, 0) + 1
+        for pin in node.pins + node.subPins:
+            sizes["pins"] += 1
+            if pin.isOutput and len(pin.connections) != 0:
+                sizes["edges"][pin.type] = sizes["edges"].get(pin.type, 0) + len(pin.connections)
+    sizes["nodes"]["total"] = len(nodes)
+    sizes["edges"]["total"] = sum(sizes["edges"].values())
+    graphSizes[key] = sizes
+
+def writeProfile():
+    if not cmdArgs.profile:
+        return
+    startPhase("")
+    report = {
+        "seconds" : sum(phase["seconds"] for phase in profilePhases.values()),
+        "phases" : profilePhases,
+        "calls" : profileCalls,
+        "graph" : graphSizes,
+    }
+    with open(cmdArgs.profile, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Profile written to " + cmdArgs.profile)
+
+def getFunctionRanges():
+    """Returns [start line, end line, Class.function] for every function in this file, for grouping profiler lines"""
+    import ast
+    with open(__file__, "r") as f:
+        tree = ast.parse(f.read())
+    ranges = []
+    for item in tree.body:
+        if isinstance(item, ast.FunctionDef):
+            ranges.append([item.lineno, item.end_lineno, item.name])
+        elif isinstance(item, ast.ClassDef):
+            for method in item.body:
+                if isinstance(method, ast.FunctionDef):
+                    ranges.append([method.lineno, method.end_lineno, item.name + "." + method.name])
+    return ranges
+
+def getFunctionAt(ranges, line):
+    for start, end, name in ranges:
+        if start <= line <= end:
+            return name
+    return "<module>"
+
+def isThisFile(path):
+    return os.path.abspath(path) == os.path.abspath(__file__)
+
+def writeCProfile():
+    cProfiler.disable()
+    import pstats
+    cProfiler.dump_stats(cmdArgs.cprofile)
+    ranges = getFunctionRanges()
+    functions = {} #Class.function -> [calls, own seconds, total seconds]
+    for (path, line, name), (primitiveCalls, calls, ownTime, totalTime, callers) in pstats.Stats(cProfiler).stats.items():
+        if not isThisFile(path):
+            continue
+        key = getFunctionAt(ranges, line) if name != "<module>" else name
+        entry = functions.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += calls
+        entry[1] += ownTime
+        entry[2] = max(entry[2], totalTime) #Wrappers like countCalls share the line range of their function
+    print("cProfile written to " + cmdArgs.cprofile + ", top " + str(cmdArgs.top) + " converter functions by own time:")
+    print("function".ljust(32) + "calls".rjust(10) + "own s".rjust(10) + "total s".rjust(10))
+    for key, (calls, ownTime, totalTime) in sorted(functions.items(), key=lambda item: -item[1][1])[:cmdArgs.top]:
+        print(key.ljust(32) + str(calls).rjust(10) + ("%.4f" % ownTime).rjust(10) + ("%.4f" % totalTime).rjust(10))
+
+def writeTracemalloc():
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ranges = getFunctionRanges()
+    functions = {} #Class.function -> [bytes, allocations]
+    lines = []
+    for stat in snapshot.statistics("lineno"):
+        frame = stat.traceback[0]
+        if not isThisFile(frame.filename):
+            continue
+        entry = functions.setdefault(getFunctionAt(ranges, frame.lineno), [0, 0])
+        entry[0] += stat.size
+        entry[1] += stat.count
+        lines.append(stat)
+    print("tracemalloc peak " + str(peak // 1024) + " KiB, still allocated " + str(current // 1024) + " KiB, top " + str(cmdArgs.top) + " converter functions:")
+    print("function".ljust(32) + "KiB".rjust(10) + "blocks".rjust(10))
+    for key, (size, count) in sorted(functions.items(), key=lambda item: -item[1][0])[:cmdArgs.top]:
+        print(key.ljust(32) + str(size // 1024).rjust(10) + str(count).rjust(10))
+    print("Top allocation sites:")
+    for stat in lines[:cmdArgs.top]:
+        frame = stat.traceback[0]
+        print(("line " + str(frame.lineno)).ljust(12) + getFunctionAt(ranges, frame.lineno).ljust(32) + str(stat.size // 1024).rjust(10) + " KiB")
+
+class TraceEvent():
+    def __init__(self) -> None:
+        self.node : str = "" #K2Node_CallFunction_3
+        self.nodeType : str = "" #K2Node_CallFunction
+        self.member : str = "" #MemberName or MacroGraph
+        self.handler : str = "" #Add function call
+        self.level : int = 0 #1 exec node, 2 pure node
+        self.firstLine : int = 0 #Line range in cpp before flattenCode and the replacements, 0 when nothing was emitted
+        self.lastLine : int = 0
+        self.start : float = 0.0
+        self.duration : float = 0.0
+        self.code : str = "" #Pure nodes only, until the exec node emits it
+
+traceEvents = deque(maxlen=traceBufferSize)
+pendingTraces : List[TraceEvent] = [] #Pure node events waiting for addCPP to place their code
+activeTraceLevel = 0 #traceLevel, or 2 while converting a node commented cpp:trace
+traceStart = 0.0
+tracedLength = 0 #Part of cpp counted into tracedLines
+tracedLines = 0
+
+def newTraceEvent(node : Node, handler, level, start):
+    event = TraceEvent()
+    event.node = node.Name
+    event.nodeType = node.Class if node.Class != "" else "Unindent"
+    event.member = node.MacroGraph if node.MacroGraph != "" else node.MemberName
+    event.handler = handler
+    event.level = level
+    event.start = start
+    return event
+
+def traceResolve(connection : PinConnection):
+    """resolveNode recorded as a trace event"""
+    start = time.perf_counter()
+    code = resolveNode(connection)
+    node = getNode(connection)
+    event = newTraceEvent(node, "Resolve " + node.Class.replace("K2Node_", ""), 2, start)
+    event.duration = time.perf_counter() - start
+    event.code = code
+    pendingTraces.append(event)
+    return code
+
+def traceCPP(code, handler):
+    """Records the exec node being converted and finds the lines of the pure nodes resolved for it in code"""
+    global tracedLength, tracedLines, traceStart
+    tracedLines += cpp.count("\n", tracedLength)
+    tracedLength = len(cpp)
+    now = time.perf_counter()
+    position = 0
+    for event in pendingTraces:
+        index = code.find(event.code, position) if event.code != "" else -1
+        if index != -1:
+            event.firstLine = tracedLines + code.count("\n", 0, index) + 1
+            event.lastLine = event.firstLine + event.code.count("\n") - 1
+            position = index + len(event.code)
+        event.code = ""
+        traceEvents.append(event)
+    pendingTraces.clear()
+    event = newTraceEvent(current, handler, 1, traceStart)
+    event.duration = now - traceStart
+    if code.count("\n") > 0:
+        event.firstLine = tracedLines + 1
+        event.lastLine = tracedLines + code.count("\n")
+    traceEvents.append(event)
+    traceStart = now
+
+def writeTrace():
+    if len(traceEvents) == 0 and not cmdArgs.trace:
+        return
+    path = cmdArgs.trace if cmdArgs.trace else "BP_to_CPP_Trace.json"
+    if cmdArgs.trace_format == "chrome":
+        origin = min(event.start for event in traceEvents) if len(traceEvents) > 0 else 0.0
+        report = {"displayTimeUnit" : "ms", "traceEvents" : [{
+            "name" : event.handler,
+            "cat" : "exec" if event.level == 1 else "pure",
+            "ph" : "X",
+            "ts" : (event.start - origin) * 1000000,
+            "dur" : event.duration * 1000000,
+            "pid" : 1,
+            "tid" : 1,
+            "args" : {"node" : event.node, "type" : event.nodeType, "member" : event.member, "lines" : [event.firstLine, event.lastLine]},
+        } for event in traceEvents]}
+    else:
+        report = [{
+            "node" : event.node,
+            "type" : event.nodeType,
+            "member" : event.member,
+            "handler" : event.handler,
+            "level" : event.level,
+            "lines" : [event.firstLine, event.lastLine],
+            "start" : event.start,
+            "duration" : event.duration,
+        } for event in traceEvents]
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    print("Trace with " + str(len(traceEvents)) + " events written to " + path)
+
+def finishProfiling():
+    """Writes the reports of --profile, --cprofile, --tracemalloc and --trace"""
+    writeProfile()
+    writeTrace()
+    if cmdArgs.cprofile:
+        writeCProfile()
+    if cmdArgs.tracemalloc:
+        writeTracemalloc()
+
+class Diagnostic():
+    def __init__(self) -> None:
+        self.node : str = "" #Empty for problems outside a node, e.g. parsing
+        self.nodeType : str = ""
+        self.member : str = "" #MemberName or MacroGraph
+        self.message : str = ""
+        self.dependsOn : str = "" #Skipped only because this node was skipped
+
+class ConversionError(Exception):
+    """Raised by error() with collectErrors while converting nodes, caught per node"""
+    def __init__(self, message, *args):
+        """args[0] = skipped node the failing node depends on"""
+        super().__init__(message)
+        self.dependsOn = args[0] if len(args) > 0 else ""
+
+diagnostics : List[Diagnostic] = []
+skippedNodes = set() #node.Name
+catchErrors = False #Set while nodes are converted, errors outside of that still end the run
+
+def addDiagnostic(node : Node, message, *args):
+    """args[0] = skipped node it depends on"""
+    diagnostic = Diagnostic()
+    if node:
+        diagnostic.node = node.Name
+        diagnostic.nodeType = node.Class
+        diagnostic.member = node.MacroGraph if node.MacroGraph != "" else node.MemberName
+    diagnostic.message = message
+    diagnostic.dependsOn = args[0] if len(args) > 0 else ""
+    diagnostics.append(diagnostic)
+
+def skipNode(node : Node, e : ConversionError, tab):
+    """Records why node couldn't be converted, drops its output variables and returns the placeholder comment\n
+    tab = currentTab before the node was converted"""
+    global currentTab
+    while currentTab > tab:
+        removeTab()
+    currentTab = tab
+    for pin in node.pins + node.subPins:
+        pinsToVariables.pop(node.Name + " " + pin.PinId, None)
+    skippedNodes.add(node.Name)
+    addDiagnostic(node, str(e), e.dependsOn)
+    member = node.MacroGraph if node.MacroGraph != "" else node.MemberName
+    return tabs() + "// BP_to_CPP: skipped " + node.Name + (" " + member if member != "" else "") + ", " + str(e).split("\n")[0] + "\n"
+
+def reportDiagnostics():
+    """Prints what collectErrors recorded and exits with 1 if anything was"""
+    if len(diagnostics) == 0:
+        return
+    problems = [diagnostic for diagnostic in diagnostics if diagnostic.dependsOn == ""]
+    dependents = [diagnostic for diagnostic in diagnostics if diagnostic.dependsOn != ""]
+    print(str(len(problems)) + " problem(s):")
+    for diagnostic in problems:
+        print((diagnostic.node + " | " + diagnostic.member + " | " if diagnostic.node != "" else "") + diagnostic.message.split("\n")[0])
+    if len(dependents) > 0:
+        print(str(len(dependents)) + " node(s) skipped because they use a skipped node:")
+        for diagnostic in dependents:
+            print(diagnostic.node + " | " + diagnostic.member + " -> " + diagnostic.dependsOn)
+    exit(1)
+
+def finishRun():
+    """Writes the reports and exits with 1 if collectErrors recorded problems, for converted and cached graphs alike"""
+    finishProfiling()
+    reportDiagnostics()
+
 def error(message):
+    if collectErrors:
+        if catchErrors:
+            raise ConversionError(message)
+        addDiagnostic(None, message)
+        reportDiagnostics()
     print(message)
     if errorTrace:
         traceback.print_stack() 
@@ -542,10 +1277,10 @@ def arrayToStr(array):
     return str0
 
 def addCPP(code, *args):
-    """args[0] = debug description : str"""
+    """args[0] = handler description for trace events"""
     global cpp
-    if debug and len(args) > 0:
-        cpp += "-----" + args[0] + "------\n"
+    if activeTraceLevel > 0:
+        traceCPP(code, args[0] if len(args) > 0 else "")
     cpp += code
 
 def addUnindentToStack(*suffix):
@@ -555,6 +1290,7 @@ def addUnindentToStack(*suffix):
         node.postCode = suffix[0]
     stack.append(node)
     connectionStack.append(None)
+    prefixStack.append("")
 
 def upperFirst(s):
     return s.replace(s[0], s[0].upper(), 1)
@@ -564,11 +1300,12 @@ def addNodeToStack(connection : PinConnection, *args):
 
     if connection.nodeName in nodes:
         node = nodes[connection.nodeName]
-        if len(args) > 0:
-            node.prefixCode += args[0]
-
         stack.append(node)
         connectionStack.append(connection)
+        if len(args) > 0:
+            prefixStack.append(args[0]) #Kept per stack entry, a shared tail node can be pushed from several branches
+        else:
+            prefixStack.append("")
     else:
         error("Node does not exist in nodes map! " + connection.nodeName)
 
@@ -719,6 +1456,8 @@ def getInPinToVariable(pin : Pin, *args):
     if key in pinsToVariables:
         # return resolveVariable(key)
         return pinsToVariables[key].name
+    elif connection.nodeName in skippedNodes:
+        raise ConversionError("Uses skipped node " + connection.nodeName, connection.nodeName)
     else:
         error("Input pin not found in pinsToVariable dictionary! " + key + " | " + pin.PinName)
     return ""
@@ -760,6 +1499,7 @@ def addOutPinToVariable(pin : Pin, valueArray : List[str], *args):
     if not isEmpty(valueArray):
         vars[variableName] = valueArray
 
+    #Subpins are named with getSubName, which resolves nested split pins through ParentPin, e.g. ReturnValue_Rotation_Roll -> Roll
     code = ""
     suffixCode = ""
     for subPin in pin.SubPins:
@@ -788,70 +1528,297 @@ def handleInputSubPins(pin : Pin):
     line = noComma(line) + struct[1]
     return line
 
+class Literal():
+    def __init__(self) -> None:
+        self.kind : str = "" #number, bool, struct
+        self.value = 0 #int/float for numbers, bool for bools, list of floats for structs
+        self.isFloat : bool = False
+        self.struct : str = "" #FVector
+
+numberRegex = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?f?$")
+structLiteralRegex = re.compile(r"^(\w+)\(([^()]*)\)$")
+foldableStructs = {"FVector", "FIntVector", "FVector2D", "FRotator", "FLinearColor"}
+structConstants = {
+    "FVector::ZeroVector" : ["FVector", [0, 0, 0]],
+    "FVector::OneVector" : ["FVector", [1, 1, 1]],
+    "FVector2D::ZeroVector" : ["FVector2D", [0, 0]],
+    "FIntVector::ZeroValue" : ["FIntVector", [0, 0, 0]],
+    "FRotator::ZeroRotator" : ["FRotator", [0, 0, 0]],
+}
+commutativeOperators = {" * ", " + ", " && ", " || "}
+identityOperands = {" * " : 1, " + " : 0, " && " : True, " || " : False} #|A op identity| == A
+intRange = (-2 ** 31, 2 ** 31 - 1) #Blueprint int is int32, results outside of it aren't folded
+floatMax = 3.4028234663852886e38 #FLT_MAX, float results past it aren't folded
+
+def parseNumber(str0):
+    """Returns Literal for int/float C++ literals, None otherwise"""
+    if not numberRegex.match(str0):
+        return None
+    lit = Literal()
+    lit.kind = "number"
+    lit.isFloat = str0.find(".") != -1 or str0.lower().find("e") != -1 or str0[-1] == "f"
+    if lit.isFloat:
+        lit.value = float(str0.rstrip("f"))
+    else:
+        lit.value = int(str0)
+    return lit
 
-def getFunctionFormat(node : Node, key : str):
-    line = ""
-    suffix = ""
-    format = functionFormat[key]
-    outPin = None
+def parseLiteral(str0):
+    """Returns Literal if str0 is a constant that can be folded, e.g. |2.0|, |true|, |FVector(0,0,100)|, None otherwise"""
+    str0 = str0.strip()
+    if str0 == "":
+        return None
+    if str0.lower() == "true" or str0.lower() == "false":
+        lit = Literal()
+        lit.kind = "bool"
+        lit.value = str0.lower() == "true"
+        return lit
+    if str0 in structConstants:
+        lit = Literal()
+        lit.kind = "struct"
+        lit.struct = structConstants[str0][0]
+        lit.value = [float(v) for v in structConstants[str0][1]]
+        return lit
+    match = structLiteralRegex.match(str0)
+    if match:
+        if not match.group(1) in foldableStructs:
+            return None
+        components = []
+        for item in match.group(2).split(","):
+            number = parseNumber(item.strip())
+            if not number:
+                return None
+            components.append(float(number.value))
+        lit = Literal()
+        lit.kind = "struct"
+        lit.struct = match.group(1)
+        lit.value = components
+        return lit
+    return parseNumber(str0)
+
+def literalToStr(lit : Literal):
+    if lit.kind == "bool":
+        return "true" if lit.value else "false"
+    if lit.kind == "struct":
+        return lit.struct + "(" + ",".join("%.9g" % v for v in lit.value) + ")"
+    if lit.isFloat:
+        str0 = "%.9g" % lit.value
+        if str0.find(".") == -1 and str0.find("e") == -1 and str0.find("n") == -1:
+            str0 += ".0"
+        return str0
+    return str(lit.value)
+
+def isIdentity(lit : Literal, operator):
+    if not operator in identityOperands or lit.kind == "struct":
+        return False
+    identity = identityOperands[operator]
+    if lit.kind == "bool":
+        return isinstance(identity, bool) and lit.value == identity
+    return not isinstance(identity, bool) and lit.value == identity
+
+def applyOperator(a, operator, b, isFloat):
+    """Returns |a operator b|, None if it can't be folded or the result doesn't fit an int32 / float"""
+    result = None
+    if operator == " + ":
+        result = a + b
+    elif operator == " - ":
+        result = a - b
+    elif operator == " * ":
+        result = a * b
+    elif operator == " / ":
+        if b == 0:
+            return None
+        if not isFloat:
+            result = int(a / b) #C++ truncates towards zero
+        else:
+            result = a / b
+    if result == None:
+        return None
+    if isFloat:
+        if result != result or abs(result) > floatMax: #nan, inf or past FLT_MAX
+            return None
+    elif result < intRange[0] or result > intRange[1]:
+        return None
+    return result
+
+def foldBinary(a : Literal, operator, b : Literal):
+    """Returns folded Literal for |a operator b|, None if it can't be folded"""
+    lit = Literal()
+    if a.kind == "bool" and b.kind == "bool":
+        lit.kind = "bool"
+        if operator == " && ":
+            lit.value = a.value and b.value
+        elif operator == " || ":
+            lit.value = a.value or b.value
+        elif operator == " == ":
+            lit.value = a.value == b.value
+        elif operator == " != ":
+            lit.value = a.value != b.value
+        else:
+            return None
+        return lit
+    if a.kind == "number" and b.kind == "number":
+        comparisons = {" > " : a.value > b.value, " >= " : a.value >= b.value, " < " : a.value < b.value,
+                       " <= " : a.value <= b.value, " == " : a.value == b.value, " != " : a.value != b.value}
+        if operator in comparisons:
+            lit.kind = "bool"
+            lit.value = comparisons[operator]
+            return lit
+        lit.kind = "number"
+        lit.isFloat = a.isFloat or b.isFloat
+        lit.value = applyOperator(a.value, operator, b.value, lit.isFloat)
+        return lit if lit.value != None else None
+    #Component-wise struct math, struct | struct of the same type or struct | scalar
+    if a.kind == "struct" or b.kind == "struct":
+        if a.kind == "struct" and b.kind == "struct" and a.struct != b.struct:
+            return None
+        if a.kind == "bool" or b.kind == "bool":
+            return None
+        lit.kind = "struct"
+        lit.struct = a.struct if a.kind == "struct" else b.struct
+        isFloat = lit.struct != "FIntVector"
+        size = len(a.value) if a.kind == "struct" else len(b.value)
+        values = []
+        for i in range(size):
+            componentA = a.value[i] if a.kind == "struct" else a.value
+            componentB = b.value[i] if b.kind == "struct" else b.value
+            value = applyOperator(componentA, operator, componentB, isFloat)
+            if value == None:
+                return None
+            values.append(value)
+        lit.value = values
+        return lit
+    return None
+
+def foldConstants(value : List[str]) -> List[str]:
+    """Folds literal operands of |var, operator, var, operator, ...| arrays\n
+    Handles n-ary math chains (|A * B * C|), functionFormat binary expressions (|"", "(", A, " op ", B, ")"|) and |"", "!(", A, ")"|\n
+    Returns a new array, or the original one if nothing could be folded"""
+    if not constantFolding:
+        return value
+
+    #functionFormat unary not
+    if len(value) == 4 and value[0] == "" and value[1] == "!(" and value[3] == ")":
+        lit = parseLiteral(value[2])
+        if lit and lit.kind == "bool":
+            lit.value = not lit.value
+            return [literalToStr(lit)]
+        return value
+
+    #functionFormat binary expression
+    if len(value) == 6 and value[0] == "" and value[1] == "(" and value[5] == ")":
+        operator = value[3]
+        a = parseLiteral(value[2])
+        b = parseLiteral(value[4])
+        if a and b:
+            lit = foldBinary(a, operator, b)
+            if lit:
+                return [literalToStr(lit)]
+            return value
+        if b and (isIdentity(b, operator) or (operator == " - " and isIdentity(b, " + ")) or (operator == " / " and isIdentity(b, " * "))):
+            return [value[2]]
+        if a and operator in commutativeOperators and isIdentity(a, operator):
+            return [value[4]]
+        return value
+
+    #Math node chain, |A op B op C ...|
+    if len(value) < 3 or len(value) % 2 == 0 or value[0] == "":
+        return value
+    operator = value[1]
+    if not operator in commutativeOperators:
+        return value
+    for i in range(1, len(value), 2):
+        if value[i] != operator:
+            return value
+    operands = []
+    folded = None
+    literalCount = 0
+    for i in range(0, len(value), 2):
+        lit = parseLiteral(value[i])
+        if lit:
+            literalCount += 1
+            if folded:
+                folded = foldBinary(folded, operator, lit)
+                if not folded:
+                    return value
+            else:
+                folded = lit
+        else:
+            operands.append(value[i])
+    if not folded:
+        return value
+    if not isEmpty(operands) and isIdentity(folded, operator):
+        folded = None
+    elif literalCount == 1 and not isEmpty(operands):
+        return value
+    if folded:
+        operands.append(literalToStr(folded))
+    result = []
+    for operand in operands:
+        result.append(operand)
+        result.append(operator)
+    result.pop()
+    return result
+
+class FunctionFormat():
+    def __init__(self) -> None:
+        self.pins : List[str] = [] #Pin names in order
+        self.slots : List[int] = [] #Index in parts of each pin's variable
+        self.parts : List[str] = [] #|var, operator, var, operator, ...| with the pin slots empty
+        self.hasOutput : bool = False #pins[0] is assigned the expression, |ReturnValue = A * B|
+
+def compileFunctionFormat(key : str, format : List[str]):
+    """Splits a functionFormat entry into pin slots and operands once, calls error() for entries that can't be used"""
+    template = FunctionFormat()
     if len(format) > 1 and format[1].find("=") != -1:
         if format[1].find(" = ") == -1:
-            error("Expecting \" = \" in format but found \"" + format[1] + "\"")
-        outPin = node.getPin(format[0])
-    vars0 = []
-    ppins = []
-    operands = []
+            error("Function format " + key + " expects \" = \" but found \"" + format[1] + "\"")
+        template.hasOutput = True
     for i, item in enumerate(format):
         if i % 2 == 0:
-            pin = node.getPin(item)
-            if pin == None:
-                error("Function format " + key + " could not find pin! " + item)
-            ppins.append(pin)
+            if item == "":
+                error("Function format " + key + " has an empty pin name at " + str(i))
+            template.pins.append(item)
+            template.slots.append(i)
+            template.parts.append("")
+        elif template.hasOutput:
+            template.parts.append(item.replace(" = ", ""))
         else:
-            if outPin and item.find(" = ") != -1:
-                operands.append(item.replace(" = ", ""))
-            else:
-                operands.append(item)
-
-    lineAdded = False
-    for ppin in ppins:
-        if ppin.isOutput:
-            if ppin != outPin:
-                suffix += addOutPinToVariable(ppin, [])
-                if not lineAdded:
-                    line += tabs()
-                line += typ(ppin) + getOutPinToVariable(ppin) + "; "
-                lineAdded = True
-        if ppin == outPin:
-            vars0.append("")
-        else:
-            vars0.append(ppin.getVar())
+            template.parts.append(item)
+    return template
 
-    if lineAdded:
-        line += "\n"
+def getFunctionFormat(node : Node, key : str):
+    template = formatTemplates[key]
+    pins = []
+    for name in template.pins:
+        pin = node.getPin(name)
+        if pin == None:
+            error("Function format " + key + " could not find pin! " + name)
+        pins.append(pin)
+    outPin = pins[0] if template.hasOutput else None
+
+    declarations = []
+    suffix = ""
+    value = list(template.parts)
+    for slot, pin in zip(template.slots, pins):
+        if pin == outPin:
+            continue
+        if pin.isOutput:
+            suffix += addOutPinToVariable(pin, [])
+            declarations.append(typ(pin) + getOutPinToVariable(pin) + "; ")
+        value[slot] = pin.getVar()
 
-    line += tabs()
+    line = ""
+    if len(declarations) > 0:
+        line = tabs() + "".join(declarations) + "\n"
 
-    next = True
-    inc = 0
-    value = []
-    while next:
-        next = False
-        if inc < len(vars0):
-            next = True
-            value.append(vars0[inc])
-        if inc < len(operands):
-            next = True
-            value.append(operands[inc])
-        inc += 1
-    
     outVar = ""
     if outPin:
+        value = foldConstants(value)
         addOutPinToVariable(outPin, value)
         outVar = typ(outPin) + outPin.getVar() + " = "
 
-    line += outVar + arrayToStr(value) + ";\n"
-    return line + suffix
+    return line + tabs() + outVar + "".join(value) + ";\n" + suffix
 
 def func(node : Node, pins : Pin, params : List[str], *args):
     """Builds the function e.g. SetVisibility(var1, true, false)
@@ -871,6 +1838,8 @@ def func(node : Node, pins : Pin, params : List[str], *args):
     if node.MemberParent in memberParentsToUse:
         f.append("")
         f.append(memberParentsToUse[node.MemberParent] + "::")
+        usedTypes.add(memberParentsToUse[node.MemberParent])
+        usedTypes.add("U" + node.MemberParent)
     elif owner != "":
         f.append(owner)
         f.append(getRelator(selfPin))
@@ -913,6 +1882,74 @@ def func(node : Node, pins : Pin, params : List[str], *args):
     f[-1] = noComma(f[-1]) + ")"
     return f
 
+def getMapFindPointer(mapPin : Pin, keyPin : Pin):
+    """Returns [code, pointer variable] for |TargetMap.Find(Key)|, reuses the pointer of a previous Find/Contains on the same map and key"""
+    mapVar = getInPinToVariable(mapPin)
+    keyVar = getInPinToVariable(keyPin)
+    key = mapVar + " " + keyVar
+    if key in mapFinds:
+        return ["", mapFinds[key].name]
+    valueType = mapPin.TerminalCategory
+    if mapPin.isTerminalPointer:
+        valueType += "*"
+    var = Variable()
+    var.name = "find" + getVarInc()
+    var.tab = currentTab
+    mapFinds[key] = var
+    return [tabs() + valueType + "* " + var.name + " = " + mapVar + ".Find(" + keyVar + ");\n", var.name]
+
+def getMapFindCode(node : Node):
+    """Map_Find/Map_Contains -> single TMap::Find(), ReturnValue is a null check and Value a dereference\n
+    TargetMap[Key] would insert or assert on a missing key"""
+    mapPin = node.getPin("TargetMap")
+    keyPin = node.getPin("Key")
+    valuePin = node.getPin("Value") #Not on Map_Contains
+    returnPin = node.getPin("ReturnValue")
+    if not mapPin or not keyPin or not returnPin:
+        error("Missing map/key/return pin for node! " + node.Name + " | " + node.MemberName)
+    line, pointer = getMapFindPointer(mapPin, keyPin)
+    suffix = ""
+    if returnPin.connected():
+        value = [pointer, " != nullptr"]
+        suffix += addOutPinToVariable(returnPin, value)
+        line += tabs() + typ(returnPin) + getOutPinToVariable(returnPin) + " = " + arrayToStr(value) + ";\n"
+    if valuePin and valuePin.connected():
+        value = [pointer, " ? *", pointer, " : ", getEmptyValue(valuePin)] #Missing keys return the default value like the BP node
+        suffix += addOutPinToVariable(valuePin, value)
+        line += tabs() + typ(valuePin) + getOutPinToVariable(valuePin) + " = " + arrayToStr(value) + ";\n"
+    return line + suffix
+
+def getMapAddCode(node : Node):
+    """Map_Add, after a Find/Contains on the same key it becomes |Map.FindOrAdd(Key) = Value|\n
+    Adding can move the map's elements, so the cached Find pointers of the map aren't used after it"""
+    mapPin = node.getPin("TargetMap")
+    keyPin = node.getPin("Key")
+    valuePin = node.getPin("Value")
+    if not mapPin or not keyPin or not valuePin:
+        error("Missing map/key/value pin for node! " + node.Name + " | " + node.MemberName)
+    mapVar = getInPinToVariable(mapPin)
+    keyVar = getInPinToVariable(keyPin)
+    valueVar = getInPinToVariable(valuePin)
+    key = mapVar + " " + keyVar
+    line = ""
+    if key in mapFinds:
+        line += tabs() + mapVar + ".FindOrAdd(" + keyVar + ") = " + valueVar + ";\n"
+    else:
+        line += tabs() + mapVar + ".Add(" + keyVar + ", " + valueVar + ");\n"
+    for findKey in [findKey for findKey in mapFinds if findKey.startswith(mapVar + " ")]:
+        del mapFinds[findKey]
+    return line
+
+def getEmptyValue(pin : Pin):
+    """Default constructed value for pin type, e.g. |nullptr|, |0|, |FString()|"""
+    if pin.isPointer:
+        return "nullptr"
+    if pin.ContainerType != "None":
+        return typ(pin).strip() + "()"
+    if pin.type == "FString" or pin.type == "FName" or pin.type == "FText" or pin.DefaultValue == "":
+        return pin.type + "()"
+    return pin.DefaultValue
+
 def getFunctionCode(node : Node):
     selfPin = node.getSelfInput()
     line = ""
@@ -926,8 +1963,14 @@ def getFunctionCode(node : Node):
             line += resolveReferences(pin)
         if pin.isOutput and pin.PinName == "ReturnValue":
             returnPin = pin
-    if debug:
-        line += "--getFunctionCode--\n"
+
+    if node.MemberParent == "BlueprintMapLibrary":
+        if node.MemberName == "Map_Find" or node.MemberName == "Map_Contains":
+            line += getMapFindCode(node)
+            return line
+        if node.MemberName == "Map_Add":
+            line += getMapAddCode(node)
+            return line
 
     #User overriden function format
     if node.MemberName in functionFormat:
@@ -991,32 +2034,7 @@ def tabs():
     return tab
 
 def typ(pin : Pin):
-    if pin.ContainerType == "Array":
-        if pin.isPointer:
-            return "TArray<" + pin.type + "*> "
-        else:
-            return "TArray<" + pin.type + "> "
-    if pin.ContainerType == "Set":
-        if pin.isPointer:
-            return "TSet<" + pin.type + "*> "
-        else:
-            return "TSet<" + pin.type + "> "
-    if pin.ContainerType == "Map":
-        if pin.isPointer:
-            if pin.isTerminalPointer:
-                return "TMap<" + pin.type + "*, " + pin.TerminalCategory + "*> "
-            else:
-                return "TMap<" + pin.type + "*, " + pin.TerminalCategory + "> "
-        else:
-            if pin.isTerminalPointer:
-                return "TMap<" + pin.type + ", " + pin.TerminalCategory + "*> "
-            else:
-                return "TMap<" + pin.type + ", " + pin.TerminalCategory + "> "
-        
-    if pin.isPointer:
-        return pin.type + "* "
-    else:
-        return pin.type + " "
+    return usePinType(pin).spelling
     
 def getRelator(pin : Pin):
     if pin.isPointer:
@@ -1058,6 +2076,7 @@ def addTwoPinBranch(node : Node):
         addUnindentToStack()
         addNodeToStack(out2.con())
         addUnindentToStack("else {")
+        stack[-1].mapFinds = dict(mapFinds) #The then branch may clear them, still valid in the else branch
         addNodeToStack(out1.con(), tabs() + "if(" + condition + ") {\n")
     elif out1:
         addUnindentToStack()
@@ -1086,6 +2105,14 @@ def removeTab():
     for key in keysToRemove:
         pinsToVariables.pop(key)
 
+    keysToRemove = []
+    for key, var in mapFinds.items():
+        if var.tab > currentTab:
+            keysToRemove.append(key)
+
+    for key in keysToRemove:
+        mapFinds.pop(key)
+
 def addBreak(node):
     b = "break_" + getVarInc()
     node.breakVar = b
@@ -1140,446 +2167,1188 @@ def getDotSeparatedName(name):
         return names[0]
     
 
-def resolveKnot(connection : PinConnection, input : bool):
-    node = getNode(connection)
-    if node.type == Knot:
-        if input:
-            if isEmpty(node.pins[0].connections):
-                error("Unconnected reroute node! " + node.Name)
-            return resolveKnot(node.pins[0].con(), input) #Will return first of many nodes if it's a grafted execution knot
-        else: #Output
-            if isEmpty(node.pins[1].connections):
-                error("Unconnected reroute node! " + node.Name)
-            return resolveKnot(node.pins[1].con(), input) #Will return first of many nodes if it's a branching data knot
+knotTargets : dict[str : List[PinConnection]] = {} #knot node.Name input/output -> connections at the end of the reroute chain
+
+def resolveKnot(connection : PinConnection, input : bool) -> List[PinConnection]:
+    """Returns the non knot connections at the end of a reroute chain, all of them if knots fan out (branching data knot, grafted execution knot)\n
+    Walks the chain without recursion and memoizes every knot on the way, so chains shared by many pins are only walked once"""
+    if getNode(connection).type != Knot:
+        return [connection]
+    direction = " input" if input else " output"
+    walk = [connection.nodeName]
+    walking = {connection.nodeName}
+    while len(walk) > 0:
+        name = walk[-1]
+        if name + direction in knotTargets:
+            walk.pop()
+            continue
+        knot = nodes[name]
+        knotPin = knot.pins[0] if input else knot.pins[1]
+        if isEmpty(knotPin.connections):
+            error("Unconnected reroute node! " + knot.Name)
+        pending = False
+        for con in knotPin.connections:
+            if getNode(con).type == Knot and not con.nodeName + direction in knotTargets:
+                if con.nodeName in walking:
+                    error("Reroute nodes are connected in a loop! " + con.nodeName)
+                walk.append(con.nodeName)
+                walking.add(con.nodeName)
+                pending = True
+        if pending:
+            continue
+        targets = []
+        keys = set()
+        for con in knotPin.connections:
+            resolved = knotTargets[con.nodeName + direction] if getNode(con).type == Knot else [con]
+            for target in resolved:
+                if not target.nodeName + " " + target.PinId in keys:
+                    keys.add(target.nodeName + " " + target.PinId)
+                    targets.append(target)
+        knotTargets[name + direction] = targets
+        walking.discard(name)
+        walk.pop()
+    return knotTargets[connection.nodeName + direction]
+
+def getConcatPins(node : Node, pins : List[Pin]):
+    """Collects the input pins of an Append chain in order, single use Append nodes connected to the inputs are inlined"""
+    for pin in node.pins:
+        if not pin.isInput or pin.PinName == "self":
+            continue
+        if len(pin.connections) == 1 and not pin.hasSubPins():
+            con = pin.con()
+            node0 = getNode(con)
+            if node0.type == Math and node0.MemberName.find("Concat_StrStr") != -1 and not con.nodeName + " " + con.PinId in pinsToVariables \
+                    and len(node0.getPinFromID(con.PinId).connections) == 1 and node0.NodeComment.find("cpp:ignore") == -1:
+                getConcatPins(node0, pins)
+                continue
+        pins.append(pin)
+
+def getConcatCode(node : Node):
+    """Append chain -> |FString::Printf(TEXT("Literal%s"), *var1)| if there are literals, otherwise one FString reserved to the total length\n
+    Each + in |a + b + c| allocates a new FString"""
+    outPin = node.getPin("ReturnValue")
+    if not outPin:
+        error("Could not find return pin on math node! " + node.Name)
+    pins = []
+    getConcatPins(node, pins)
+    code = ""
+    suffix = ""
+    for pin in pins:
+        code += resolveReferences(pin)
+
+    hasLiteral = False
+    for pin in pins:
+        if not pin.connected() and not pin.hasSubPins():
+            hasLiteral = True
+    if hasLiteral:
+        format = ""
+        args = []
+        for pin in pins:
+            if not pin.connected() and not pin.hasSubPins():
+                format += pin.DefaultValue.replace("%", "%%")
+            else:
+                format += "%s"
+                args.append(getInPinToVariable(pin))
+        if isEmpty(args):
+            value = ["", "TEXT(\"" + format.replace("%%", "%") + "\")"]
+        else:
+            value = ["", "FString::Printf(TEXT(\"" + format + "\"), *"]
+            for arg in args:
+                value.append(arg)
+                value.append(", *")
+            value[-1] = ")"
+        suffix += addOutPinToVariable(outPin, value)
+        code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
+    elif len(pins) <= 2: #a + b is already a single allocation
+        value = []
+        for pin in pins:
+            value.append(getInPinToVariable(pin))
+            value.append(" + ")
+        value.pop()
+        suffix += addOutPinToVariable(outPin, value)
+        code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
     else:
-        return connection
+        suffix += addOutPinToVariable(outPin, [])
+        var = getOutPinToVariable(outPin)
+        lengths = []
+        for pin in pins:
+            lengths.append(getInPinToVariable(pin) + ".Len()")
+        code += tabs() + typ(outPin) + var + ";\n"
+        code += tabs() + var + ".Reserve(" + " + ".join(lengths) + ");\n"
+        for pin in pins:
+            code += tabs() + var + " += " + getInPinToVariable(pin) + ";\n"
+    return code + suffix
 
-def resolveReferences(pin : Pin, *args):
+def needsResolving(pin : Pin):
+    """Returns True if resolving the input pin would generate code, e.g. it's connected to a pure function that isn't cached in pinsToVariables yet"""
+    for con in pin.connections:
+        if con.nodeName + " " + con.PinId in pinsToVariables:
+            continue
+        node = getNode(con)
+        if node.type == VariableGet and node.selfIsContext():
+            continue
+        return True
+    for subPin in pin.SubPins:
+        if needsResolving(subPin):
+            return True
+    return False
+
+def findReachable(root : Node):
+    """Names of the nodes reachable from root following exec outputs and pure inputs, goes through knots"""
+    reachable = {root.Name}
+    walk = [root]
+    while len(walk) > 0:
+        node = walk.pop()
+        for pin in node.pins + node.subPins:
+            if (pin.isExec and pin.isOutput) or (not pin.isExec and pin.isInput):
+                for con in pin.connections:
+                    if con.nodeName in nodes and not con.nodeName in reachable:
+                        reachable.add(con.nodeName)
+                        walk.append(nodes[con.nodeName])
+    return reachable
+
+def getExecSuccessors(node : Node) -> List[PinConnection]:
+    """Exec connections leaving node, the Break pin of ForLoopWithBreak is a flag and not a jump so it's left out"""
+    successors = []
+    if node.NodeComment.find("cpp:ignore") != -1:
+        return successors
+    for pin in node.pins:
+        if pin.isExec and pin.isOutput:
+            for con in pin.connections:
+                target = getNode(con)
+                if target.MacroGraph == "StandardMacros:ForLoopWithBreak" and target.getPinFromID(con.PinId).PinName == "Break":
+                    continue
+                successors.append(con)
+    return successors
+
+def computeDominators(root : Node):
+    """Immediate dominators of the exec graph reachable from root (Cooper, Harvey, Kennedy)\n
+    Returns [node.Name -> idom node.Name, node.Name -> reverse postorder index]"""
+    postorder = []
+    visited = {root.Name}
+    dfs = [[root.Name, iter(getExecSuccessors(root))]]
+    while len(dfs) > 0:
+        name, it = dfs[-1]
+        con = next(it, None)
+        if con == None:
+            dfs.pop()
+            postorder.append(name)
+        elif not con.nodeName in visited:
+            visited.add(con.nodeName)
+            dfs.append([con.nodeName, iter(getExecSuccessors(nodes[con.nodeName]))])
+    order = {}
+    predecessors = {}
+    for idx, name in enumerate(reversed(postorder)):
+        order[name] = idx
+        predecessors[name] = []
+    for name in postorder:
+        for con in getExecSuccessors(nodes[name]):
+            predecessors[con.nodeName].append(name)
+
+    idoms = {root.Name : root.Name}
+    def intersect(a, b):
+        while a != b:
+            while order[a] > order[b]:
+                a = idoms[a]
+            while order[b] > order[a]:
+                b = idoms[b]
+        return a
+    changed = True
+    while changed:
+        changed = False
+        for name in reversed(postorder):
+            if name == root.Name:
+                continue
+            newIdom = None
+            for pred in predecessors[name]:
+                if pred in idoms:
+                    newIdom = pred if newIdom == None else intersect(pred, newIdom)
+            if idoms.get(name) != newIdom:
+                idoms[name] = newIdom
+                changed = True
+    return idoms, order
+
+def dominates(a : str, b : str, idoms):
+    while True:
+        if a == b:
+            return True
+        if idoms[b] == b:
+            return False
+        b = idoms[b]
+
+def findSharedTails(root : Node):
+    """Finds exec input pins with multiple connections\n
+    Forward merges become a lambda declared at the immediate dominator of the merge node and called from each connection,
+    connections looping back to a dominating node become a goto to a label\n
+    A goto can't leave a lambda, so a lambda with a back edge to a label outside of it returns the label's number and its callers jump\n
+    Lambdas that read the outputs of the loop dominating them are declared inside its body"""
+    idoms, order = computeDominators(root)
+    backEdges = [] #[connection, source node.Name, label key]
+    calls = [] #[connection, source node.Name, tail key]
+    for name, node in nodes.items():
+        if not name in idoms or node.NodeComment.find("cpp:ignore") != -1:
+            continue
+        for pin in node.pins:
+            if not pin.isExec or not pin.isInput or len(pin.connections) < 2:
+                continue
+            if node.MacroGraph == "StandardMacros:ForLoopWithBreak" and pin.PinName == "Break":
+                continue #Each break is a single assignment
+            key = name + " " + pin.PinId
+            forwardCount = 0
+            for con in pin.connections:
+                if not con.nodeName in idoms:
+                    continue #Not reachable from the start node
+                isBackEdge = dominates(name, con.nodeName, idoms)
+                for con0 in getExecSuccessors(nodes[con.nodeName]):
+                    if con0.nodeName == name and con0.PinId == pin.PinId:
+                        con0.isBackEdge = isBackEdge
+                        if isBackEdge:
+                            backEdges.append([con0, con.nodeName, key])
+                        else:
+                            calls.append([con0, con.nodeName, key])
+                if isBackEdge:
+                    if not key in tailLabels:
+                        tailLabels[key] = "loop" + getVarInc()
+                else:
+                    forwardCount += 1
+            if forwardCount > 1:
+                dominator = idoms[name]
+                declarations = tailsByDominator
+                if nodes[dominator].MacroGraph in loopMacros and readsOutputsOf(name, dominator, idoms):
+                    declarations = loopTails #Declared inside the loop body to see its index and element
+                if not dominator in declarations:
+                    declarations[dominator] = []
+                c = PinConnection()
+                c.nodeName = name
+                c.PinId = pin.PinId
+                c.isTailBody = True
+                declarations[dominator].append(c)
+                tails[key] = "tail" + getVarInc()
+                tailReturns[key] = []
+
+    calls = [call for call in calls if call[2] in tails]
+    for con0, source, key in calls:
+        dominator = idoms[key.split(" ")[0]]
+        if dominator in loopTails and any(c.nodeName + " " + c.PinId == key for c in loopTails[dominator]) and not inLoopBody(con0, source, dominator, idoms):
+            error("Shared tail " + key.split(" ")[0] + " reads the outputs of " + dominator + " and is also called after the loop, they only exist inside of it")
+
+    #Labels a lambda returns, its own back edges and the ones of the lambdas it calls
+    changed = True
+    while changed:
+        changed = False
+        jumps = [[source, label] for con0, source, label in backEdges]
+        for con0, source, key in calls:
+            jumps.extend([source, label] for label in tailReturns[key])
+        for key in tails:
+            for source, label in jumps:
+                if not label in tailReturns[key] and leavesTail(key, source, label, idoms):
+                    tailReturns[key].append(label)
+                    changed = True
+
+    for con0, source, label in backEdges:
+        con0.jump = getJump(source, label, idoms)
+    for con0, source, key in calls:
+        call = tails[key] + "()"
+        if len(tailReturns[key]) == 0:
+            con0.jump = call + ";"
+        elif len(tailReturns[key]) == 1:
+            label = tailReturns[key][0]
+            con0.jump = "if(" + call + " == " + getLabelNumber(label) + ") " + getJump(source, label, idoms)
+        else:
+            con0.jump = "switch(" + call + ") {"
+            for label in tailReturns[key]:
+                con0.jump += " case " + getLabelNumber(label) + ": " + getJump(source, label, idoms)
+            con0.jump += " }"
+
+def readsOutputsOf(name : str, source : str, idoms) -> bool:
+    """True if the nodes dominated by name read a data output of source, directly or through pure nodes"""
+    walk = [name0 for name0 in idoms if dominates(name, name0, idoms)]
+    visited = set(walk)
+    while len(walk) > 0:
+        for pin in nodes[walk.pop()].pins:
+            if pin.isExec or not pin.isInput:
+                continue
+            for con in getInputConnections(pin):
+                if con.nodeName == source:
+                    return True
+                if not con.nodeName in visited and not getNode(con).hasInputExec():
+                    visited.add(con.nodeName)
+                    walk.append(con.nodeName)
+    return False
+
+def inLoopBody(connection : PinConnection, source : str, loop : str, idoms) -> bool:
+    """True if the exec connection leaving source is run by the LoopBody pin of loop"""
+    body = nodes[loop].getPin("LoopBody").connections
+    if source == loop:
+        return connection in body
+    return len(body) > 0 and dominates(body[0].nodeName, source, idoms)
+
+def leavesTail(key : str, source : str, label : str, idoms) -> bool:
+    """True if a jump from source to the label key leaves the lambda of the tail key"""
+    name = key.split(" ")[0]
+    return dominates(name, source, idoms) and not dominates(name, label.split(" ")[0], idoms)
+
+def getLabelNumber(label : str) -> str:
+    """Value a lambda returns to jump to the label key, 0 is a normal return"""
+    return str(list(tailLabels).index(label) + 1)
+
+def getJump(source : str, label : str, idoms) -> str:
+    """goto to the label key, or return of its number if the jump leaves a lambda"""
+    for key in tails:
+        if leavesTail(key, source, label, idoms):
+            return "return " + getLabelNumber(label) + ";"
+    return "goto " + tailLabels[label] + ";"
+
+def addTailsToStack(bodies : List[PinConnection]):
+    """Pushes the lambda declarations of shared tails, they're emitted before any of their calls"""
+    for con in bodies:
+        key = con.nodeName + " " + con.PinId
+        addUnindentToStack(";")
+        if len(tailReturns[key]) > 0:
+            stack[-1].preCode = "return 0;"
+            addNodeToStack(con, tabs() + "auto " + tails[key] + " = [&]() -> int {\n")
+        else:
+            addNodeToStack(con, tabs() + "auto " + tails[key] + " = [&]() {\n")
+
+def getInputConnections(pin : Pin) -> List[PinConnection]:
+    """Connections of an input pin and its subpins, subpins first"""
+    connections = []
+    for subPin in pin.SubPins:
+        connections.extend(getInputConnections(subPin))
+    connections.extend(pin.connections) #Handle multiple inputs into data pins
+    return connections
+
+def getDependencyPins(node : Node) -> List[Pin]:
+    """Input pins resolveNode resolves before adding the node's own line"""
+    if node.type == Select:
+        optionPins = []
+        for pin in node.pins:
+            if pin.isInput and pin.PinName.find("Option ") != -1:
+                optionPins.append(pin)
+        if lazySelect and any(needsResolving(option) for option in optionPins):
+            return [node.getPin("Index")] #Options are resolved inside their switch case
+        return optionPins + [node.getPin("Index")]
+    if node.type == Math and batchStringConcat and node.MemberName.find("Concat_StrStr") != -1:
+        pins = []
+        getConcatPins(node, pins)
+        return pins
+    pins = []
+    selfPin = node.getSelfInput()
+    if selfPin:
+        pins.append(selfPin)
+    for pin in node.pins:
+        if pin != selfPin and pin.isInput and not pin.isExec:
+            pins.append(pin)
+    return pins
+
+def getPureDependencies(pin : Pin) -> List[PinConnection]:
+    """Returns the connections of the unresolved nodes pin depends on in topological order, dependencies first\n
+    Walks the graph with an explicit stack, each node is visited once"""
+    order = []
+    visited = set()
+    walk = [[None, iter(getInputConnections(pin))]]
+    while len(walk) > 0:
+        connection, it = walk[-1]
+        dependency = next(it, None)
+        if dependency == None:
+            walk.pop()
+            if connection:
+                order.append(connection)
+            continue
+        if dependency.nodeName + " " + dependency.PinId in pinsToVariables or dependency.nodeName in visited:
+            continue
+        visited.add(dependency.nodeName)
+        connections = []
+        for pin0 in getDependencyPins(getNode(dependency)):
+            connections.extend(getInputConnections(pin0))
+        walk.append([dependency, iter(connections)])
+    return order
+
+def resolveReferences(pin : Pin):
     """Intended to generate code for all the variables needed for current node\n
-    Handles subPins\n"""
+    Handles subPins\n
+    The pure nodes needed are emitted in topological order, so resolving their own inputs finds them already in pinsToVariables"""
     if pin.isExec:
         return ""
     if pin.isOutput:
         return ""
     code = ""
-    suffix = ""
-    for subPin in pin.SubPins:
-        code += resolveReferences(subPin)
-    if len(pin.connections) == 0:
-        return code + suffix
-    
-    if len(args) == 0:
-        for con in pin.connections: #Handle multiple inputs into data pins
-            code += resolveReferences(pin, con)
-        return code
-    connection = args[0]
-    if not connection.nodeName + " " + connection.PinId in pinsToVariables:
-        node0 : Node = getNode(connection)
-        #Function is only responsible for adding one output variable for current node and pin
-        #Need to add code for specifying variable if variable is not already defined in context
-        if node0.type == VariableGet:
-            outPin = node0.variableGetPin()
-            if node0.selfIsContext(): #Reached end of chain, node does not have any more references to resolve
-                debugDesc = ""
-                if debug:
-                    debugDesc = "--Resolve VariableGet Self Context--\n"
-                suffix += addOutPinToVariable(outPin, [], cleanVar(outPin.PinName)) #output pin
-                return debugDesc + code + suffix
-            else: #Need to resolve node going left
-                selfPin = node0.getSelfInput()
-                owner = ""
-                key = ""
-                if selfPin:
-                    code += resolveReferences(selfPin)
-                    owner = getInPinToVariable(selfPin)
-                    key = selfPin.type + " " + outPin.PinName
-                if debug:
-                    code += "--Resolve VariableGet Other Context--\n"
-                value = []
-                relator = ""
-                if owner != "":
-                    relator = "->"
-                if key in VariableGetsToFunctions:
-                    value = [owner, relator + VariableGetsToFunctions[key]]
+    for connection in getPureDependencies(pin):
+        if not connection.nodeName + " " + connection.PinId in pinsToVariables and not connection.nodeName in skippedNodes: #Other outputs of a node are added with it
+            tab = currentTab
+            try:
+                if activeTraceLevel > 1:
+                    code += traceResolve(connection)
                 else:
-                    value = [owner, relator + cleanVar(outPin.PinName)]
-                suffix += addOutPinToVariable(outPin, value)
-                code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == Function: #Most likely a pure function
-            code += getFunctionCode(node0)
-        elif node0.type == VariableSet:
-            outPin = node0.variableGetPin()
-            if node0.selfIsContext(): #Reached end of chain, node does not have any more references to resolve
-                suffix += addOutPinToVariable(outPin, [], cleanVar(node0.MemberName)) #output pin
-                return code + suffix
-            else: #Need to resolve node going left
-                selfPin = node0.getSelfInput()
-                owner = ""
-                relator = ""
-                if selfPin:
-                    code += resolveReferences(selfPin)
-                    owner = getInPinToVariable(selfPin)
-                    relator = "->"
-                if debug:
-                    code += "--Resolve VariableSet--\n"
-                value = [owner, relator + cleanVar(node0.MemberName)]
-                suffix += addOutPinToVariable(outPin, value)
-                code += tabs() + typ(outPin) + getInPinToVariable(pin) + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == GetArrayItem:
-            arrayPin = None
-            dimensionPin = None
-            outPin = None
-            for pin0 in node0.pins:
-                if pin0.isInput and pin0.PinName == "Array":
-                    arrayPin = pin0
-                elif pin0.isInput and pin0.PinName == "Dimension 1":
-                    dimensionPin = pin0
-                elif pin0.isOutput and pin0.PinName == "Output":
-                    outPin = pin0
-            if not arrayPin or not dimensionPin or not outPin:
-                error("Missing array/dimension/out pin for node! " + node0.Name)
-            code += resolveReferences(arrayPin)
-            code += resolveReferences(dimensionPin)
-            value = [getInPinToVariable(arrayPin), "[" , getInPinToVariable(dimensionPin) , "]"]
-            suffix += addOutPinToVariable(outPin, value)
-            if debug:
-                code += "--Resolve GetArrayItem--\n"
-            code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == Math:
-            outPin = None
-            for pin in node0.pins:
-                if pin.isInput and pin.PinName != "self":
-                    code += resolveReferences(pin)
-                if pin.PinName == "ReturnValue":
-                    outPin = pin
-            if not outPin:
-                error("Could not find return pin on math node! " + node0.Name)
-            operator = ""
-            if node0.MemberName.find("Multiply") != -1:
-                operator = " * "
-            elif node0.MemberName.find("Add") != -1:
-                operator = " + "
-            elif node0.MemberName.find("BooleanAND") != -1:
-                operator = " && "
-            elif node0.MemberName.find("BooleanOR") != -1:
-                operator = " || "
-            elif node0.MemberName.find("Concat_StrStr") != -1:
-                operator = " + "
-            else:
-                error("Could not resolve math type! " + node0.MemberName + " | " + node0.Name)
-            if debug:
-                code += "--Resolve Math--\n"
+                    code += resolveNode(connection)
+            except ConversionError as e:
+                code += skipNode(getNode(connection), e, tab)
+    return code
+
+def resolveNode(connection : PinConnection):
+    """Adds the code and output variables for the node connection points to, its inputs should already be resolved"""
+    code = ""
+    suffix = ""
+    node0 : Node = getNode(connection)
+    #Function is only responsible for adding one output variable for current node and pin
+    #Need to add code for specifying variable if variable is not already defined in context
+    if node0.type == VariableGet:
+        outPin = node0.variableGetPin()
+        if node0.selfIsContext(): #Reached end of chain, node does not have any more references to resolve
+            suffix += addOutPinToVariable(outPin, [], cleanVar(outPin.PinName)) #output pin
+            return code + suffix
+        else: #Need to resolve node going left
+            selfPin = node0.getSelfInput()
+            owner = ""
+            key = ""
+            if selfPin:
+                code += resolveReferences(selfPin)
+                owner = getInPinToVariable(selfPin)
+                key = selfPin.type + " " + outPin.PinName
             value = []
-            for pin in node0.pins:
-                if pin.isInput and pin.PinName != "self":
-                    value.append(getInPinToVariable(pin))
-                    value.append(operator)
-            value.pop() #Remove extra operator
+            relator = ""
+            if owner != "":
+                relator = "->"
+            if key in VariableGetsToFunctions:
+                value = [owner, relator + VariableGetsToFunctions[key]]
+            else:
+                value = [owner, relator + cleanVar(outPin.PinName)]
             suffix += addOutPinToVariable(outPin, value)
             code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == MakeArray:
-            outPin = None 
-            for pin in node0.pins:
-                if pin.isInput:
-                    code += resolveReferences(pin)
-                else:
-                    outPin = pin
-            if not outPin:
-                error("Could not find return pin on make array node! " + node0.Name)
-            if debug:
-                code += "--Resolve Make Array--\n"
-            value = ["", "{"]
-            for pin in node0.pins:
-                if pin.isInput:
-                    value.append(getInPinToVariable(pin))
-                    value.append(", ")
-            value[-1] = "}" #Remove extra comma
-            suffix += addOutPinToVariable(outPin, []) #Causes errors when it flattens code to {a, b, c}[i1], so keep this as a separate variable
+    elif node0.type == Function: #Most likely a pure function
+        code += getFunctionCode(node0)
+    elif node0.type == VariableSet:
+        outPin = node0.variableGetPin()
+        if node0.selfIsContext(): #Reached end of chain, node does not have any more references to resolve
+            suffix += addOutPinToVariable(outPin, [], cleanVar(node0.MemberName)) #output pin
+            return code + suffix
+        else: #Need to resolve node going left
+            selfPin = node0.getSelfInput()
+            owner = ""
+            relator = ""
+            if selfPin:
+                code += resolveReferences(selfPin)
+                owner = getInPinToVariable(selfPin)
+                relator = "->"
+            value = [owner, relator + cleanVar(node0.MemberName)]
+            suffix += addOutPinToVariable(outPin, value)
             code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == Macro:
-            if node0.MacroGraph in functionFormat:
-                for pin in node0.pins:
-                    if not pin.isExec and pin.isInput:
-                        code += resolveReferences(pin)
-                if debug:
-                    code += "--Resolve Macro | Function Format--\n"
-                code += getFunctionFormat(node0, node0.MacroGraph)
-            elif node0.MacroGraph == "W4_Macros_Object:FloatCurve" or node0.MacroGraph == "W4_Macros_Object:VectorCurve":
-                type0 = "float "
-                function0 = "W4::floatCurve("
-                function1 = "->GetFloatValue("
-                if node0.MacroGraph == "W4_Macros_Object:VectorCurve":
-                    type0 = "FVector "
-                    function0 = "W4::vectorCurve("
-                    function1 = "->GetVectorValue("
-                curvePin = node0.getPin("Curve")
-                timePin = node0.getPin("Time")
-                resultPin = node0.getPin("Result")
-                metPin = node0.getPin("Target Met")
-                code += resolveReferences(curvePin)
-                code += resolveReferences(timePin)
-                if debug:
-                    code += "--Resolve Macro | Float/Vector Curve--\n"
-                if metPin.connected():
-                    suffix += addOutPinToVariable(resultPin, [])
-                    value = ["", function0, getInPinToVariable(curvePin), ", " , getInPinToVariable(timePin), ", ", getOutPinToVariable(resultPin), ")"]
-                    suffix += addOutPinToVariable(metPin, value)
-                    code += tabs() + type0 + getOutPinToVariable(resultPin) + ";\n"
-                    code += tabs() + "bool " + getOutPinToVariable(metPin) + " = " + arrayToStr(value) + ";\n"
-                else:
-                    value = [getInPinToVariable(curvePin), function1, getInPinToVariable(timePin), ")"]
-                    suffix += addOutPinToVariable(resultPin, value)
-                    code += tabs() + type0 + getOutPinToVariable(resultPin) + " = " + arrayToStr(value) + ";\n"
-            elif node0.MacroGraph == "W4_Macros_Object:AddIntVector":
-                v1Pin : Pin = node0.getPin("V1")
-                v2Pin : Pin = node0.getPin("V2")
-                resultPin : Pin = node0.getPin("Result")
-                code += resolveReferences(v1Pin)
-                code += resolveReferences(v2Pin)
-                if debug:
-                    code += "--Resolve Macro | AddIntVector--\n"
-                value = [getInPinToVariable(v1Pin), " + ", getInPinToVariable(v2Pin)]
-                suffix += addOutPinToVariable(resultPin, value)
-                code += tabs() + "FIntVector " + getOutPinToVariable(resultPin) + " = " + arrayToStr(value) + ";\n"
-            # elif node0.MacroGraph in EasyMacroCalls:
+    elif node0.type == GetArrayItem:
+        arrayPin = None
+        dimensionPin = None
+        outPin = None
+        for pin0 in node0.pins:
+            if pin0.isInput and pin0.PinName == "Array":
+                arrayPin = pin0
+            elif pin0.isInput and pin0.PinName == "Dimension 1":
+                dimensionPin = pin0
+            elif pin0.isOutput and pin0.PinName == "Output":
+                outPin = pin0
+        if not arrayPin or not dimensionPin or not outPin:
+            error("Missing array/dimension/out pin for node! " + node0.Name)
+        code += resolveReferences(arrayPin)
+        code += resolveReferences(dimensionPin)
+        value = [getInPinToVariable(arrayPin), "[" , getInPinToVariable(dimensionPin) , "]"]
+        suffix += addOutPinToVariable(outPin, value)
+        code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
+    elif node0.type == Math and batchStringConcat and node0.MemberName.find("Concat_StrStr") != -1:
+        code += getConcatCode(node0)
+    elif node0.type == Math:
+        outPin = None
+        for pin in node0.pins:
+            if pin.isInput and pin.PinName != "self":
+                code += resolveReferences(pin)
+            if pin.PinName == "ReturnValue":
+                outPin = pin
+        if not outPin:
+            error("Could not find return pin on math node! " + node0.Name)
+        operator = ""
+        if node0.MemberName.find("Multiply") != -1:
+            operator = " * "
+        elif node0.MemberName.find("Add") != -1:
+            operator = " + "
+        elif node0.MemberName.find("BooleanAND") != -1:
+            operator = " && "
+        elif node0.MemberName.find("BooleanOR") != -1:
+            operator = " || "
+        elif node0.MemberName.find("Concat_StrStr") != -1:
+            operator = " + "
+        else:
+            error("Could not resolve math type! " + node0.MemberName + " | " + node0.Name)
+        value = []
+        for pin in node0.pins:
+            if pin.isInput and pin.PinName != "self":
+                value.append(getInPinToVariable(pin))
+                value.append(operator)
+        value.pop() #Remove extra operator
+        value = foldConstants(value)
+        suffix += addOutPinToVariable(outPin, value)
+        code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
+    elif node0.type == MakeArray:
+        outPin = None 
+        for pin in node0.pins:
+            if pin.isInput:
+                code += resolveReferences(pin)
             else:
-                if debug:
-                    code += "--Resolve Macro | Easy Macro Call--\n"
-                code += easyMacroCall(node0)
-            # else:
-                # error("Unhandled macro graph for resolving references! " + node0.MacroGraph)
-        elif node0.type == BreakStruct:
-            inPin = node0.breakInPin()
-            code += resolveReferences(inPin)
-            if debug:
-                code += "--Resolve BreakStruct--\n"
-            for pin in node0.pins:
-                if pin.isOutput:
-                    if pin.connected():
-                        value = [getInPinToVariable(inPin), ".", cleanVar(pin.PinName)]
-                        suffix += addOutPinToVariable(pin, value)
-                        code += tabs() + typ(pin) + pin.getVar() + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == Select:
-            optionPins = []
+                outPin = pin
+        if not outPin:
+            error("Could not find return pin on make array node! " + node0.Name)
+        value = ["", "{"]
+        for pin in node0.pins:
+            if pin.isInput:
+                value.append(getInPinToVariable(pin))
+                value.append(", ")
+        value[-1] = "}" #Remove extra comma
+        suffix += addOutPinToVariable(outPin, []) #Causes errors when it flattens code to {a, b, c}[i1], so keep this as a separate variable
+        code += tabs() + typ(outPin) + getOutPinToVariable(outPin) + " = " + arrayToStr(value) + ";\n"
+    elif node0.type == Macro:
+        if node0.MacroGraph in functionFormat:
             for pin in node0.pins:
-                if pin.isInput and pin.PinName.find("Option ") != -1:
-                    optionPins.append(pin)
+                if not pin.isExec and pin.isInput:
                     code += resolveReferences(pin)
-            indexPin = node0.getPin("Index")
-            code += resolveReferences(indexPin)
-            returnPin = node0.getPin("ReturnValue")
-            value = []
-            indexVar = getInPinToVariable(indexPin)
-            endOperator = ""
+            code += getFunctionFormat(node0, node0.MacroGraph)
+        elif node0.MacroGraph == "W4_Macros_Object:FloatCurve" or node0.MacroGraph == "W4_Macros_Object:VectorCurve":
+            type0 = "float "
+            function0 = "W4::floatCurve("
+            function1 = "->GetFloatValue("
+            if node0.MacroGraph == "W4_Macros_Object:VectorCurve":
+                type0 = "FVector "
+                function0 = "W4::vectorCurve("
+                function1 = "->GetVectorValue("
+            curvePin = node0.getPin("Curve")
+            timePin = node0.getPin("Time")
+            resultPin = node0.getPin("Result")
+            metPin = node0.getPin("Target Met")
+            code += resolveReferences(curvePin)
+            code += resolveReferences(timePin)
+            if metPin.connected():
+                suffix += addOutPinToVariable(resultPin, [])
+                value = ["", function0, getInPinToVariable(curvePin), ", " , getInPinToVariable(timePin), ", ", getOutPinToVariable(resultPin), ")"]
+                suffix += addOutPinToVariable(metPin, value)
+                code += tabs() + type0 + getOutPinToVariable(resultPin) + ";\n"
+                code += tabs() + "bool " + getOutPinToVariable(metPin) + " = " + arrayToStr(value) + ";\n"
+            else:
+                value = [getInPinToVariable(curvePin), function1, getInPinToVariable(timePin), ")"]
+                suffix += addOutPinToVariable(resultPin, value)
+                code += tabs() + type0 + getOutPinToVariable(resultPin) + " = " + arrayToStr(value) + ";\n"
+        elif node0.MacroGraph == "W4_Macros_Object:AddIntVector":
+            v1Pin : Pin = node0.getPin("V1")
+            v2Pin : Pin = node0.getPin("V2")
+            resultPin : Pin = node0.getPin("Result")
+            code += resolveReferences(v1Pin)
+            code += resolveReferences(v2Pin)
+            value = [getInPinToVariable(v1Pin), " + ", getInPinToVariable(v2Pin)]
+            suffix += addOutPinToVariable(resultPin, value)
+            code += tabs() + "FIntVector " + getOutPinToVariable(resultPin) + " = " + arrayToStr(value) + ";\n"
+        # elif node0.MacroGraph in EasyMacroCalls:
+        else:
+            code += easyMacroCall(node0)
+        # else:
+            # error("Unhandled macro graph for resolving references! " + node0.MacroGraph)
+    elif node0.type == BreakStruct:
+        inPin = node0.breakInPin()
+        code += resolveReferences(inPin)
+        for pin in node0.pins:
+            if pin.isOutput:
+                if pin.connected():
+                    value = [getInPinToVariable(inPin), ".", cleanVar(pin.PinName)]
+                    suffix += addOutPinToVariable(pin, value)
+                    code += tabs() + typ(pin) + pin.getVar() + " = " + arrayToStr(value) + ";\n"
+    elif node0.type == Select:
+        optionPins = []
+        for pin in node0.pins:
+            if pin.isInput and pin.PinName.find("Option ") != -1:
+                optionPins.append(pin)
+        indexPin = node0.getPin("Index")
+        code += resolveReferences(indexPin)
+        returnPin = node0.getPin("ReturnValue")
+        indexVar = getInPinToVariable(indexPin)
+        if lazySelect and any(needsResolving(option) for option in optionPins):
+            #Only evaluate the pure chain of the selected option
+            suffix += addOutPinToVariable(returnPin, [])
+            code += tabs() + typ(returnPin) + returnPin.getVar() + ";\n"
+            code += tabs() + "switch(" + indexVar + ") {\n"
+            addTab()
             for idx, option in enumerate(optionPins):
                 if idx == len(optionPins) - 1:
-                    value.append(getInPinToVariable(option))
+                    code += tabs() + "default: {\n" #Matches the ternary, out of range indices return the last option
                 else:
-                    value.append(indexVar)
-                    value.append(" == " + str(idx) + " ? ")
-                    value.append(getInPinToVariable(option))
-                    value.append(" : (")
-                    endOperator += ")"
-            value.append(endOperator)
-            suffix += addOutPinToVariable(returnPin, value)
-            code += tabs() + typ(returnPin) + returnPin.getVar() + " = " + arrayToStr(value) + ";\n"
-        elif node0.type == ArrayFunction:
-            if node0.arrayFunctionType == ArrayLength:
-                arrayPin = node0.getPin("TargetArray")
-                returnPin = node0.getPin("ReturnValue")
-                code += resolveReferences(arrayPin)
-                value = [getInPinToVariable(arrayPin), ".Num()"]
-                suffix += addOutPinToVariable(returnPin, value)
-                code += tabs() + "int " + getOutPinToVariable(returnPin) + " = " + arrayToStr(value) + ";\n"
+                    code += tabs() + "case " + str(idx) + ": {\n"
+                addTab()
+                code += resolveReferences(option)
+                code += tabs() + returnPin.getVar() + " = " + getInPinToVariable(option) + ";\n"
+                code += tabs() + "break;\n"
+                removeTab()
+                code += tabs() + "}\n"
+            removeTab()
+            code += tabs() + "}\n"
+            return code + suffix
+        for option in optionPins:
+            code += resolveReferences(option)
+        value = []
+        endOperator = ""
+        for idx, option in enumerate(optionPins):
+            if idx == len(optionPins) - 1:
+                value.append(getInPinToVariable(option))
             else:
-                error(f"Unhandled array function type for resolving references! {node0.arrayFunctionType}")
+                value.append(indexVar)
+                value.append(" == " + str(idx) + " ? ")
+                value.append(getInPinToVariable(option))
+                value.append(" : (")
+                endOperator += ")"
+        value.append(endOperator)
+        suffix += addOutPinToVariable(returnPin, value)
+        code += tabs() + typ(returnPin) + returnPin.getVar() + " = " + arrayToStr(value) + ";\n"
+    elif node0.type == ArrayFunction:
+        if node0.arrayFunctionType == ArrayLength:
+            arrayPin = node0.getPin("TargetArray")
+            returnPin = node0.getPin("ReturnValue")
+            code += resolveReferences(arrayPin)
+            value = [getInPinToVariable(arrayPin), ".Num()"]
+            suffix += addOutPinToVariable(returnPin, value)
+            code += tabs() + "int " + getOutPinToVariable(returnPin) + " = " + arrayToStr(value) + ";\n"
         else:
-            error("Unhandled node type for resolving references! Type " + str(node0.type) + " | " + node0.Name)
+            error(f"Unhandled array function type for resolving references! {node0.arrayFunctionType}")
+    elif node0.type == Unsupported:
+        error("Unsupported node class! " + node0.Class)
+    else:
+        error("Unhandled node type for resolving references! Type " + str(node0.type) + " | " + node0.Name)
 
     return code + suffix
 
 
 
-# Read the clipboard content
-clipboard_content = pyperclip.paste()
-
-lines = clipboard_content.split("\r\n")
-
-nodes = {}
-inc = 0
-currentLine = ""
-for line in lines:
-    inc += 1
-    currentLine = line
-    if line.find("Begin Object") != -1:
-        ignoreNode = False
-        n = Node()
-        name = cleanBP(lFind("Name"))
-        n.Name = name
-        type = lFind3("Class")
-        if type == "/Script/BlueprintGraph.K2Node_Tunnel":
-            n.type = Tunnel
-        elif type == "/Script/BlueprintGraph.K2Node_FunctionEntry":
-            n.type = FunctionEntry
-        elif type == "/Script/BlueprintGraph.K2Node_VariableGet":
-            n.type = VariableGet
-        elif type == "/Script/BlueprintGraph.K2Node_VariableSet":
-            n.type = VariableSet
-        elif type == "/Script/BlueprintGraph.K2Node_CallFunction":
-            n.type = Function
-        elif type == "/Script/BlueprintGraph.K2Node_CallMaterialParameterCollectionFunction":
-            n.type = Function
-        elif type == "/Script/BlueprintGraph.K2Node_MacroInstance":
-            n.type = Macro
-        elif type == "/Script/BlueprintGraph.K2Node_CallArrayFunction":
-            n.type = Function
-            # n.type = ArrayFunction
-            # arrayFunctionType = ""
-            # if lines[inc].find("MemberName") != -1:
-            #     arrayFunctionType = lFind("MemberName", lines[inc]) #Check the next line
-            # elif lines[inc + 1].find("MemberName") != -1:
-            #     arrayFunctionType = lFind("MemberName", lines[inc + 1]) #Check the next next line (can have bIsPureFunc=True on first line)
-            # else:
-            #     error("Could not find Array function member name!\nLine " + str(inc - 1) + "\n" + line)
-            # if arrayFunctionType == "\"Array_Set\")":
-            #     n.arrayFunctionType = ArraySet
-            # elif arrayFunctionType == "\"Array_Length\")":
-            #     n.arrayFunctionType = ArrayLength
-            # elif arrayFunctionType == "\"Array_Add\")":
-            #     n.arrayFunctionType = ArrayAdd
-            # elif arrayFunctionType == "\"Array_Clear\")":
-            #     n.arrayFunctionType = ArrayClear
-            # else:
-            #     error("Unknown array function type! " + arrayFunctionType)
-
-        elif type == "/Script/BlueprintGraph.K2Node_GetArrayItem":
-            n.type = GetArrayItem
-        elif type == "/Script/BlueprintGraph.K2Node_DynamicCast":
-            n.type = Cast
-        elif type == "/Script/BlueprintGraph.K2Node_IfThenElse":
-            n.type = IfThen
-        elif type == "/Script/BlueprintGraph.K2Node_ExecutionSequence":
-            n.type = Sequence
-        elif type == "/Script/BlueprintGraph.K2Node_CommutativeAssociativeBinaryOperator":
-            n.type = Math
-        elif type == "/Script/BlueprintGraph.K2Node_MakeArray":
-            n.type = MakeArray
-        elif type == "/Script/BlueprintGraph.K2Node_Knot":
-            n.type = Knot
-        elif type == "/Script/UnrealEd.EdGraphNode_Comment":
-            ignoreNode = True
-        elif type == "/Script/BlueprintGraph.K2Node_FunctionResult":
-            n.type = FunctionResult
-        elif type == "/Script/BlueprintGraph.K2Node_BreakStruct":
-            n.type = BreakStruct
-        elif type == "/Script/BlueprintGraph.K2Node_Select":
-            n.type = Select
-        else:
-            error("Unknown node type! " + type)
-        if not ignoreNode:
-            nodes[name] = n
-    elif line.find("LocalVariables(") != -1:
-        v = Pin()
-        v.node = n
-        v.PinName = cleanBP(lFind("VarName"))
-        category = cleanBP(lFind("PinCategory"))
-        v.type = getTypeFromBP(category, "PinSubCategoryObject")
-        v.PinId = v.PinName
-        v.isExec = False
-        if category == "object":
-            v.isPointer = True
-        elif category == "byte":
-            v.Enum = cleanBP(lFind("PinSubCategoryObject").split(".")[1])
-        elif category == "class":
-            v.isPointer = True
-        if line.find("ContainerType") != -1:
-            v.ContainerType = cleanBP(lFind("ContainerType"))
-        if v.ContainerType == "Map":
-            category = cleanBP(lFind("TerminalCategory"))
-            if line.find("TerminalSubCategoryObject") != -1:
-                v.TerminalCategory = getTypeFromBP(category, "TerminalSubCategoryObject")
-            else:
-                v.TerminalCategory = getTypeFromBP(category, None)
-            if category == "object":
-                v.isTerminalPointer = True
-        getDefaultValue(v)
-        v.isInput = False
-        v.isOutput = True
-        n.LocalVariables.append(v)
-    elif line.find("FunctionReference=") != -1:
-        if line.find("MemberParent") != -1:
-            n.MemberParent = cleanBP(lFind("MemberParent").split(".")[1])
-        n.MemberName = cleanFunction(cleanBP(lFind("MemberName")))
-        if n.MemberName in memberNameReplacements:
-            n.MemberName = memberNameReplacements[n.MemberName]
-    elif line.find("VariableReference=") != -1:
-        n.MemberName = cleanBP(lFind("MemberName"))
-        if n.MemberName in memberNameReplacements:
-            n.MemberName = memberNameReplacements[n.MemberName]
-    elif line.find("NodeComment=") != -1:
-        n.NodeComment = cleanBP(lFind("NodeComment"))
-    elif line.find("CustomProperties Pin") != -1:
-        p = Pin()
-        p.node = n
-        p.PinId = lFind("PinId")
-        category = cleanBP(lFind("PinType.PinCategory"))
-        p.type = getTypeFromBP(category, "PinType.PinSubCategoryObject")
-        if category == "exec":
-            p.isExec = True
-        elif category == "object":
-            p.isPointer = True
-        elif category == "byte":
-            p.Enum = cleanBP(lFind("PinType.PinSubCategoryObject").split(".")[1])
-        elif category == "class":
-            p.isPointer = True
-        p.ContainerType = lFind("PinType.ContainerType")
-        if p.ContainerType == "Map":
-            category = cleanBP(lFind("TerminalCategory"))
-            if line.find("TerminalSubCategoryObject") != -1:
-                p.TerminalCategory = getTypeFromBP(category, "TerminalSubCategoryObject")
+def parseGraph(content):
+    """Fills nodes from T3D clipboard text\n
+    line, currentLine, inc, n and p are global for lFind, getDefaultValue and getTypeFromBP"""
+    global nodes, inc, currentLine, line, n, p
+    nodes = {}
+    inc = 0
+    currentLine = ""
+    for line in content.split("\r\n"):
+        inc += 1
+        currentLine = line
+        if line.find("Begin Object") != -1:
+            ignoreNode = False
+            n = Node()
+            name = cleanBP(lFind("Name"))
+            n.Name = name
+            type = lFind3("Class")
+            n.Class = type.split(".")[-1]
+            if type == "/Script/BlueprintGraph.K2Node_Tunnel":
+                n.type = Tunnel
+            elif type == "/Script/BlueprintGraph.K2Node_FunctionEntry":
+                n.type = FunctionEntry
+            elif type == "/Script/BlueprintGraph.K2Node_VariableGet":
+                n.type = VariableGet
+            elif type == "/Script/BlueprintGraph.K2Node_VariableSet":
+                n.type = VariableSet
+            elif type == "/Script/BlueprintGraph.K2Node_CallFunction":
+                n.type = Function
+            elif type == "/Script/BlueprintGraph.K2Node_CallMaterialParameterCollectionFunction":
+                n.type = Function
+            elif type == "/Script/BlueprintGraph.K2Node_MacroInstance":
+                n.type = Macro
+            elif type == "/Script/BlueprintGraph.K2Node_CallArrayFunction":
+                n.type = Function
+                # n.type = ArrayFunction
+                # arrayFunctionType = ""
+                # if lines[inc].find("MemberName") != -1:
+                #     arrayFunctionType = lFind("MemberName", lines[inc]) #Check the next line
+                # elif lines[inc + 1].find("MemberName") != -1:
+                #     arrayFunctionType = lFind("MemberName", lines[inc + 1]) #Check the next next line (can have bIsPureFunc=True on first line)
+                # else:
+                #     error("Could not find Array function member name!\nLine " + str(inc - 1) + "\n" + line)
+                # if arrayFunctionType == "\"Array_Set\")":
+                #     n.arrayFunctionType = ArraySet
+                # elif arrayFunctionType == "\"Array_Length\")":
+                #     n.arrayFunctionType = ArrayLength
+                # elif arrayFunctionType == "\"Array_Add\")":
+                #     n.arrayFunctionType = ArrayAdd
+                # elif arrayFunctionType == "\"Array_Clear\")":
+                #     n.arrayFunctionType = ArrayClear
+                # else:
+                #     error("Unknown array function type! " + arrayFunctionType)
+
+            elif type == "/Script/BlueprintGraph.K2Node_GetArrayItem":
+                n.type = GetArrayItem
+            elif type == "/Script/BlueprintGraph.K2Node_DynamicCast":
+                n.type = Cast
+            elif type == "/Script/BlueprintGraph.K2Node_IfThenElse":
+                n.type = IfThen
+            elif type == "/Script/BlueprintGraph.K2Node_ExecutionSequence":
+                n.type = Sequence
+            elif type == "/Script/BlueprintGraph.K2Node_CommutativeAssociativeBinaryOperator":
+                n.type = Math
+            elif type == "/Script/BlueprintGraph.K2Node_MakeArray":
+                n.type = MakeArray
+            elif type == "/Script/BlueprintGraph.K2Node_Knot":
+                n.type = Knot
+            elif type == "/Script/UnrealEd.EdGraphNode_Comment":
+                ignoreNode = True
+            elif type == "/Script/BlueprintGraph.K2Node_FunctionResult":
+                n.type = FunctionResult
+            elif type == "/Script/BlueprintGraph.K2Node_BreakStruct":
+                n.type = BreakStruct
+            elif type == "/Script/BlueprintGraph.K2Node_Select":
+                n.type = Select
             else:
-                p.TerminalCategory = getTypeFromBP(category, None)
+                if not collectErrors:
+                    error("Unknown node type! " + type)
+                n.type = Unsupported #Reported if it's converted
+            if not ignoreNode:
+                nodes[name] = n
+        elif line.find("LocalVariables(") != -1:
+            v = Pin()
+            v.node = n
+            v.PinName = cleanBP(lFind("VarName"))
+            category = cleanBP(lFind("PinCategory"))
+            v.type = getTypeFromBP(category, "PinSubCategoryObject")
+            v.PinId = v.PinName
+            v.isExec = False
             if category == "object":
-                p.isTerminalPointer = True
-        p.PinName = cleanBP(lFind("PinName"))
-        if p.PinName == "__WorldContext":
-            continue #Skip adding this pin
-        getDefaultValue(p)
-        if line.find("DefaultObject=") != -1:
-            p.DefaultObject = "U" + cleanBP(lFind("DefaultObject")).split(".")[1]
-
-        if line.find("Direction=\"EGPD_Output\"") == -1:
-            p.isInput = True
-        p.isOutput = not p.isInput
+                v.isPointer = True
+            elif category == "byte":
+                v.Enum = cleanBP(lFind("PinSubCategoryObject").split(".")[1])
+            elif category == "class":
+                v.isPointer = True
+            if line.find("ContainerType") != -1:
+                v.ContainerType = cleanBP(lFind("ContainerType"))
+            if v.ContainerType == "Map":
+                category = cleanBP(lFind("TerminalCategory"))
+                if line.find("TerminalSubCategoryObject") != -1:
+                    v.TerminalCategory = getTypeFromBP(category, "TerminalSubCategoryObject")
+                else:
+                    v.TerminalCategory = getTypeFromBP(category, None)
+                if category == "object":
+                    v.isTerminalPointer = True
+            getDefaultValue(v)
+            v.isInput = False
+            v.isOutput = True
+            n.LocalVariables.append(v)
+        elif line.find("FunctionReference=") != -1:
+            if line.find("MemberParent") != -1:
+                n.MemberParent = cleanBP(lFind("MemberParent").split(".")[1])
+            n.MemberName = cleanFunction(cleanBP(lFind("MemberName")))
+            if n.MemberName in memberNameReplacements:
+                n.MemberName = memberNameReplacements[n.MemberName]
+        elif line.find("VariableReference=") != -1:
+            n.MemberName = cleanBP(lFind("MemberName"))
+            if n.MemberName in memberNameReplacements:
+                n.MemberName = memberNameReplacements[n.MemberName]
+        elif line.find("NodeComment=") != -1:
+            n.NodeComment = cleanBP(lFind("NodeComment"))
+        elif line.find("CustomProperties Pin") != -1:
+            p = Pin()
+            p.node = n
+            p.PinId = lFind("PinId")
+            category = cleanBP(lFind("PinType.PinCategory"))
+            p.type = getTypeFromBP(category, "PinType.PinSubCategoryObject")
+            if category == "exec":
+                p.isExec = True
+            elif category == "object":
+                p.isPointer = True
+            elif category == "byte":
+                p.Enum = cleanBP(lFind("PinType.PinSubCategoryObject").split(".")[1])
+            elif category == "class":
+                p.isPointer = True
+            p.ContainerType = lFind("PinType.ContainerType")
+            if p.ContainerType == "Map":
+                category = cleanBP(lFind("TerminalCategory"))
+                if line.find("TerminalSubCategoryObject") != -1:
+                    p.TerminalCategory = getTypeFromBP(category, "TerminalSubCategoryObject")
+                else:
+                    p.TerminalCategory = getTypeFromBP(category, None)
+                if category == "object":
+                    p.isTerminalPointer = True
+            p.PinName = cleanBP(lFind("PinName"))
+            if p.PinName == "__WorldContext":
+                continue #Skip adding this pin
+            getDefaultValue(p)
+            if line.find("DefaultObject=") != -1:
+                p.DefaultObject = "U" + cleanBP(lFind("DefaultObject")).split(".")[1]
+
+            if line.find("Direction=\"EGPD_Output\"") == -1:
+                p.isInput = True
+            p.isOutput = not p.isInput
         
-        if line.find("LinkedTo=") != -1:
-            for connection in lFind2("LinkedTo"):
-                c = PinConnection()
-                c.nodeName = connection.split(" ")[0]
-                c.PinId = connection.split(" ")[1]
-                p.connections.append(c)
-        if line.find("SubPins=") != -1:
-            for pin in lFind2("SubPins"):
-                c = PinConnection()
-                c.nodeName = pin.split(" ")[0]
-                c.PinId = pin.split(" ")[1]
-                p.SubPinCons.append(c)
-        isSubPin = False
-        if line.find("ParentPin=") != -1:
-            parentId = cleanBP(lFind("ParentPin")).split(" ")[1]
-            p.ParentPin = n.getPinFromID(parentId)
-            isSubPin = True
-        if isSubPin:
-            n.subPins.append(p)
+            if line.find("LinkedTo=") != -1:
+                for connection in lFind2("LinkedTo"):
+                    c = PinConnection()
+                    c.nodeName = connection.split(" ")[0]
+                    c.PinId = connection.split(" ")[1]
+                    p.connections.append(c)
+            if line.find("SubPins=") != -1:
+                for pin in lFind2("SubPins"):
+                    c = PinConnection()
+                    c.nodeName = pin.split(" ")[0]
+                    c.PinId = pin.split(" ")[1]
+                    p.SubPinCons.append(c)
+            isSubPin = False
+            if line.find("ParentPin=") != -1:
+                parentId = cleanBP(lFind("ParentPin")).split(" ")[1]
+                p.ParentPin = n.getPinFromID(parentId)
+                isSubPin = True
+            if isSubPin:
+                n.subPins.append(p)
+            else:
+                n.pins.append(p)
+        elif line.find("MacroGraphReference=") != -1:
+            n.MacroGraph = cleanBP(getDotSeparatedName(lFind("MacroGraph")))
+        elif line.find("ResolvedWildcardType=") != -1:
+            category = cleanBP(lFind("PinCategory"))
+            p.ResolvedWildcardType = getTypeFromBP(category, "PinSubCategoryObject")
+    return nodes
+
+#Macros with a handler of their own, keep in sync with the Macro branches of resolveNode and the traversal, other macros become easyMacroCall calls
+handledMacros = {
+    "StandardMacros:ForEachLoop",
+    "StandardMacros:IsValid",
+    "StandardMacros:ForLoop",
+    "StandardMacros:ForLoopWithBreak",
+    "W4_Macros_Object:FloatCurve",
+    "W4_Macros_Object:VectorCurve",
+    "W4_Macros_Object:AddIntVector",
+}
+loopMacros = {"StandardMacros:ForEachLoop", "StandardMacros:ForLoop", "StandardMacros:ForLoopWithBreak"}
+coverageExtensions = (".t3d", ".txt", ".copy")
+nonStructTypes = {"FName", "FString", "FText", "FFieldClass"}
+#Public members of engine structs, split pins named otherwise need a SubPinGetters entry, other structs are assumed to use their field names
+structFields = {
+    "FVector" : {"X", "Y", "Z"},
+    "FIntVector" : {"X", "Y", "Z"},
+    "FVector2D" : {"X", "Y"},
+    "FRotator" : {"Roll", "Pitch", "Yaw"},
+    "FLinearColor" : {"R", "G", "B", "A"},
+    "FTransform" : set(), #Location, Rotation and Scale are private
+}
+
+def addCoverage(counts, category, item, fileName):
+    entry = counts.setdefault((category, item), [0, set()])
+    entry[0] += 1
+    entry[1].add(fileName)
+
+def countCoverage(counts, fileName):
+    """Counts what the parsed nodes use that the converter has no handler or table entry for"""
+    for node in nodes.values():
+        if node.type == Unsupported:
+            addCoverage(counts, "Unknown node type", node.Class, fileName)
+        elif node.type == Function and node.MemberParent != "" and not node.MemberName in functionFormat:
+            name = node.MemberParent + "::" + node.MemberName
+            selfPin = node.getSelfInput()
+            static = selfPin == None or (not selfPin.connected() and selfPin.DefaultObject != "")
+            if node.MemberName.startswith("K2_"):
+                addCoverage(counts, "Not in memberNameReplacements", name, fileName)
+            elif static and not node.MemberParent in memberParentsToUse:
+                addCoverage(counts, "Not in memberParentsToUse", name, fileName)
+        elif node.type == Macro and not node.MacroGraph in handledMacros and not node.MacroGraph in functionFormat:
+            cached = macroCacheDir != "" and findCachedMacro(node.MacroGraph)
+            addCoverage(counts, "easyMacroCall" + (" (cached)" if cached else ""), node.MacroGraph, fileName)
+        for pin in node.subPins:
+            parentType = pin.ParentPin.type
+            if pin.isOutput and parentType in structFields:
+                name = pin.getSubName()
+                if not name in structFields[parentType] and not name in SubPinGetters.get(parentType, {}).values():
+                    addCoverage(counts, "Not in SubPinGetters", parentType + "." + name, fileName)
+        for pin in node.pins + node.subPins:
+            if not pin.type.startswith("F") or pin.type in nonStructTypes:
+                continue
+            split = len(pin.SubPinCons) > 0
+            if pin.isInput and (split or not pin.connected()) and not pin.type in Structs:
+                addCoverage(counts, "Not in Structs", pin.type, fileName)
+
+def runCoverage(paths):
+    """Parses every exported graph under paths and prints what's missing, most frequent first"""
+    global collectErrors, catchErrors
+    collectErrors = True #Unknown node classes and pin categories are recorded instead of ending the run
+    catchErrors = True
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith(coverageExtensions)]
         else:
-            n.pins.append(p)
-    elif line.find("MacroGraphReference=") != -1:
-        n.MacroGraph = cleanBP(getDotSeparatedName(lFind("MacroGraph")))
-    elif line.find("ResolvedWildcardType=") != -1:
-        category = cleanBP(lFind("PinCategory"))
-        p.ResolvedWildcardType = getTypeFromBP(category, "PinSubCategoryObject")
+            files.append(path)
+    counts = {} #(category, item) -> [count, files]
+    for fileName in files:
+        with open(fileName, "r", newline="", encoding="utf-8", errors="replace") as f:
+            content = f.read().replace("\r\n", "\n").replace("\n", "\r\n") #Saved exports may have lost the \r
+        try:
+            parseGraph(content)
+        except ConversionError as e:
+            addCoverage(counts, "Parse error", str(e).split("\n")[0], fileName)
+            continue
+        for diagnostic in diagnostics:
+            addCoverage(counts, "Unknown pin category", diagnostic.message.split("! ")[-1], fileName)
+        diagnostics.clear()
+        countCoverage(counts, fileName)
+
+    print(str(len(files)) + " graph(s) parsed, " + str(len(counts)) + " unsupported item(s)")
+    if len(counts) == 0:
+        return
+    rows = sorted(counts.items(), key=lambda item: (-item[1][0], -len(item[1][1]), item[0]))
+    categoryWidth = max(len("category"), max(len(category) for (category, item), entry in rows))
+    print("count".rjust(7) + "files".rjust(7) + "  " + "category".ljust(categoryWidth) + "  item")
+    for (category, item), (count, fileNames) in rows:
+        print(str(count).rjust(7) + str(len(fileNames)).rjust(7) + "  " + category.ljust(categoryWidth) + "  " + item)
+
+
+if cmdArgs.profile:
+    resolveReferences = countCalls("resolveReferences", resolveReferences)
+    getVarInc = countCalls("getVarInc", getVarInc)
+    Node.getPinFromID = countCalls("getPinFromID", Node.getPinFromID)
+    Pin.inUse = countCalls("inUse", Pin.inUse)
+    removeTab = countCalls("removeTab", removeTab)
+
+#Only imported when asked for, the conversion runs untouched otherwise
+if cmdArgs.cprofile:
+    import cProfile
+    cProfiler = cProfile.Profile()
+    cProfiler.enable()
+if cmdArgs.tracemalloc:
+    import tracemalloc
+    tracemalloc.start()
+
+tableKinds = { #Table -> what its entries map to
+    "postReplacements" : "text",
+    "postRegexReplacements" : "regex",
+    "memberNameReplacements" : "text",
+    "memberParentsToUse" : "text",
+    "replacePin" : "pair",
+    "Structs" : "pair",
+    "functionFormat" : "format",
+    "SubPinGetters" : "getters",
+    "actorTypes" : "names",
+    "componentTypes" : "names",
+    "VariableGetsToFunctions" : "text",
+    "includeHeaders" : "text",
+}
+
+class Tables():
+    def __init__(self) -> None:
+        self.stamp : tuple = () #mtimes of the script and the tables file
+        self.values : dict = {} #Table name -> merged and validated table
+        self.regexReplacements : list = [] #(compiled pattern, replacement) of postRegexReplacements
+        self.formatTemplates : dict[str : FunctionFormat] = {} #functionFormat compiled by key
+        self.digest : str = "" #Hash of the tables file, part of the macro cache hash
+
+#Validated tables by tablesFile, --watch passes it to every conversion so unchanged tables aren't read and checked again
+tableCache : dict[str : Tables] = globals().get("tableCache", {})
+watching = globals().get("watching", False) #Set for the conversions started by --watch
+regexReplacements = []
+formatTemplates : dict[str : FunctionFormat] = {}
+tablesDigest = ""
+
+def isText(value):
+    return isinstance(value, str)
+
+def validateTable(name, table):
+    """Calls error() for the first entry that doesn't fit the table"""
+    kind = tableKinds[name]
+    if kind == "names":
+        for value in table:
+            if not isText(value):
+                error("Bad " + name + " entry in " + tablesFile + "! " + json.dumps(value))
+        return
+    for key, value in table.items():
+        if kind == "text" or kind == "regex":
+            valid = isText(value)
+        elif kind == "pair":
+            valid = isinstance(value, list) and len(value) == 2 and all(isText(part) for part in value)
+        elif kind == "format":
+            valid = isinstance(value, list) and len(value) > 0 and all(isText(part) for part in value)
+        else:
+            valid = isinstance(value, dict) and all(isText(getter) for getter in value.values())
+        if not valid:
+            error("Bad " + name + " entry in " + tablesFile + "! " + key + " : " + json.dumps(value))
+
+def readTables(defaults):
+    """Merges tablesFile over the default tables and validates them, returns Tables"""
+    tables = Tables()
+    tables.values = {name : (set(table) if tableKinds[name] == "names" else dict(table)) for name, table in defaults.items()}
+    if os.path.isfile(tablesFile):
+        with open(tablesFile, "rb") as f:
+            data = f.read()
+        tables.digest = hashlib.sha1(data).hexdigest()
+        try:
+            project = json.loads(data)
+        except ValueError as e:
+            error("Tables file " + tablesFile + " isn't valid JSON! " + str(e))
+        if not isinstance(project, dict):
+            error("Tables file " + tablesFile + " must be an object of tables by name!")
+        for name, entries in project.items():
+            if not name in tableKinds:
+                error("Unknown table in " + tablesFile + "! " + name)
+            if tableKinds[name] == "names":
+                if not isinstance(entries, list):
+                    error(name + " in " + tablesFile + " must be a list!")
+                tables.values[name].update(entries)
+                continue
+            if not isinstance(entries, dict):
+                error(name + " in " + tablesFile + " must be an object!")
+            for key, value in entries.items():
+                if value == None:
+                    tables.values[name].pop(key, None)
+                else:
+                    tables.values[name][key] = value
+    for name, table in tables.values.items():
+        validateTable(name, table)
+    for pattern, replacement in tables.values["postRegexReplacements"].items():
+        try:
+            tables.regexReplacements.append((re.compile(pattern), replacement))
+        except re.error as e:
+            error("Bad postRegexReplacements pattern! " + pattern + " (" + str(e) + ")")
+    for key, format in tables.values["functionFormat"].items():
+        tables.formatTemplates[key] = compileFunctionFormat(key, format)
+    return tables
+
+def loadTables():
+    """Sets the tables to the defaults merged with tablesFile, reusing tableCache while neither file changed"""
+    global regexReplacements, formatTemplates, tablesDigest
+    stamp = (os.path.getmtime(__file__), os.path.getmtime(tablesFile) if os.path.isfile(tablesFile) else None)
+    tables = tableCache.get(tablesFile)
+    if tables == None or tables.stamp != stamp:
+        tables = readTables({name : globals()[name] for name in tableKinds})
+        tables.stamp = stamp
+        tableCache[tablesFile] = tables
+        if watching:
+            print("Loaded tables" + (" from " + tablesFile if tables.digest != "" else ""))
+    globals().update(tables.values)
+    regexReplacements = tables.regexReplacements
+    formatTemplates = tables.formatTemplates
+    tablesDigest = tables.digest
+
+def watchClipboard():
+    """Converts every new graph copied to the clipboard until interrupted\nEach conversion runs this script again with fresh state, only tableCache is kept"""
+    import runpy
+    print("Watching the clipboard, Ctrl+C to stop")
+    last = pyperclip.paste()
+    try:
+        while True:
+            time.sleep(watchInterval)
+            content = pyperclip.paste()
+            if content == last:
+                continue
+            last = content
+            if content.find("Begin Object") == -1:
+                continue
+            print("Converting...")
+            try:
+                runpy.run_path(__file__, init_globals={"tableCache" : tableCache, "watching" : True})
+            except SystemExit:
+                pass
+            except Exception:
+                traceback.print_exc()
+            last = pyperclip.paste() #The output was copied to the clipboard
+    except KeyboardInterrupt:
+        pass
+
+startPhase("tables")
+loadTables()
+
+if cmdArgs.watch and not watching:
+    watchClipboard()
+    exit()
+
+if cmdArgs.coverage:
+    runCoverage(cmdArgs.coverage)
+    exit()
+
+# Read the clipboard content
+startPhase("read")
+clipboard_content = pyperclip.paste()
+
+#Unchanged macro graph that was already converted
+graphHash = ""
+if macroCacheDir != "":
+    graphHash = getGraphHash(clipboard_content)
+    cachedMacro = findCachedMacroByHash(graphHash)
+    if cachedMacro:
+        print("Macro unchanged, using " + os.path.join(macroCacheDir, cachedMacro["file"]))
+        functionName = cachedMacro["function"]
+        with open(os.path.join(macroCacheDir, cachedMacro["file"]), "r") as f:
+            writeOutput(f.read())
+        finishRun()
+        exit()
+
+startPhase("parse")
+parseGraph(clipboard_content)
+
+countGraph("parsed")
+
+#Find start node, reading the exec degrees from fanOutTable
+startPhase("startNode")
+for key, node in nodes.items():
+    addFanOut(node) #Early pass, refreshed in the fanOut phase once pruning and knot untangling changed the connections
+for key, val in nodes.items():
+    if not val.hasInputExec() and val.hasOutputExec():
+        startNode = val
+
+#Macro with execs, the output tunnel's pins are returned by reference
+if startNode != None and startNode.type == Tunnel:
+    for key, node in nodes.items():
+        if node.type == Tunnel and node != startNode:
+            endNode = node
+
+#Check if this is a macro without execs, just evaluate outputs
+if startNode == None:
+    for key, node in nodes.items():
+        if node.type == Tunnel and node.Name == "K2Node_Tunnel_0":
+            startNode = node
+        if node.type == Tunnel and node.Name == "K2Node_Tunnel_1":
+            endNode = node
+    if startNode == None or endNode == None:
+        error("Start/End node not found!")
+    #Create an exec pin to connect the two nodes
+    c = PinConnection()
+    c.PinId = "EndNode"
+    c.nodeName = "K2Node_Tunnel_1"
+    p = Pin()
+    p.PinId = "StartNode"
+    p.isExec = True
+    p.isInput = False
+    p.isOutput = True
+    p.connections = [c]
+    p.type = "exec"
+    p.PinName = "StartNode"
+    p.node = startNode
+    startNode.pins.append(p)
+
+    c = PinConnection()
+    c.PinId = "StartNode"
+    c.nodeName = "K2Node_Tunnel_0"
+    p = Pin()
+    p.PinId = "EndNode"
+    p.isExec = True
+    p.isInput = True
+    p.isOutput = False
+    p.connections = [c]
+    p.type = "exec"
+    p.PinName = "EndNode"
+    p.node = endNode
+    endNode.pins.append(p)
+
+#Drop nodes the start node can't reach, e.g. other events or leftovers in the selection, before the passes over all nodes
+startPhase("prune")
+if pruneUnreachable:
+    reachable = findReachable(startNode)
+    pruned = []
+    for key, node in nodes.items():
+        if not key in reachable and node.type != FunctionResult: #The first FunctionResult is used for the function declaration
+            pruned.append(key)
+    for key in pruned:
+        nodes.pop(key)
+    for key, node in nodes.items():
+        for pin in node.pins + node.subPins:
+            if any(not con.nodeName in nodes for con in pin.connections):
+                pin.connections = [con for con in pin.connections if con.nodeName in nodes]
+    if reportPruned and not isEmpty(pruned):
+        print("Pruned " + str(len(pruned)) + " node(s) not reachable from " + startNode.Name + ":")
+        for key in pruned:
+            print(key)
 
 #Resolve subpins connections to pins
+startPhase("subPins")
 for key, node in nodes.items():
     for pin in node.pins:
         for con in pin.SubPinCons:
@@ -1603,6 +3372,7 @@ def fixRotationSubpins(pin : Pin):
         index += 1
 
 #Swap pins in transforms to match C++ form: FTransform(FRotator, FVector, FVector)
+startPhase("transforms")
 for key, node in nodes.items():
     for index, pin in enumerate(node.pins):
         rotationPins = []
@@ -1634,30 +3404,37 @@ for key, node in nodes.items():
             fixRotationSubpins(pin)
     
 #Untangle all knots (Reroute pins)
+startPhase("knots")
 for key, node in nodes.items():
-    for pin in node.pins:
-        if len(pin.connections) > 0:
-            for idx, con in enumerate(pin.connections):
-                node = getNode(con)
-                if node.type == Knot:
-                    pin.connections[idx] = resolveKnot(con, pin.isInput)
-    for pin in node.subPins:
-        if len(pin.connections) > 0:
-            for idx, con in enumerate(pin.connections):
-                node = getNode(con)
-                if node.type == Knot:
-                    pin.connections[idx] = resolveKnot(con, pin.isInput)
+    if node.type == Knot:
+        continue
+    for pin in node.pins + node.subPins:
+        if any(getNode(con).type == Knot for con in pin.connections):
+            connections = []
+            for con in pin.connections:
+                for target in resolveKnot(con, pin.isInput):
+                    c = PinConnection() #Copied, resolved connections are shared between every pin going through the knot
+                    c.nodeName = target.nodeName
+                    c.PinId = target.PinId
+                    connections.append(c)
+            pin.connections = connections
+
+startPhase("fanOut")
+fanOutTable.clear() #Drops the entries of pruned nodes
+for key, node in nodes.items():
+    addFanOut(node)
+countGraph("converted")
 
 # branches = {} #node.Name_pin.PinId -> branch name
 # branchesAdded = {} #Set of node.Name_pin.PinId
 #Add branches for multi connected input execs
 multiNodeWarningAdded = False
 for key, node in nodes.items():
-    if not node.NodeComment.find("cpp:ignore") != -1:
+    fanOut = fanOutTable[node.Name]
+    if node.NodeComment.find("cpp:ignore") == -1 and node.NodeComment.find("cpp:cache") == -1 and fanOut.execIn == 0 \
+            and node.type != Knot and node.type != Tunnel and not (node.type == VariableGet and fanOut.selfIsContext):
         for pin in node.pins:
-            if pin.isInput and pin.isExec and len(pin.connections) > 1:
-                error("Multiple input execs entering a node is not allowed! " + node.Name + "|" + node.MemberName + "|" + node.NodeComment + "\nTry using multiple macro instances or sequences instead")
-            if node.type != Knot and not (node.type == VariableGet and node.selfIsContext()) and not node.type == Tunnel and not node.hasInputExec() and pin.isOutput and pin.numUniqueNodeConnections() > 1 and node.NodeComment.find("cpp:cache") == -1:
+            if pin.isOutput and fanOut.uniqueConsumers[pin.PinId] > 1:
                 if not multiNodeWarningAdded:
                     print("Warning! There are pure node(s) that are connected to multiple nodes, this may cause incorrect behavior since this value will be cached in a variable.")
                     print("Try duplicating the node or add cpp:cache as a comment to the node.")
@@ -1676,58 +3453,57 @@ for key, node in nodes.items():
                 #     addBranch(p)
                 # break
 
-#Find start node
-for key, val in nodes.items():
-    if not val.hasInputExec() and val.hasOutputExec():
-        startNode = val
-
-#Check if this is a macro without execs, just evaluate outputs
-if startNode == None:
-    for key, node in nodes.items():
-        if node.type == Tunnel and node.Name == "K2Node_Tunnel_0":
-            startNode = node
-        if node.type == Tunnel and node.Name == "K2Node_Tunnel_1":
-            endNode = node
-    if startNode == None or endNode == None:
-        error("Start/End node not found!")
-    #Create an exec pin to connect the two nodes
-    c = PinConnection()
-    c.PinId = "EndNode"
-    c.nodeName = "K2Node_Tunnel_1"
-    p = Pin()
-    p.PinId = "StartNode"
-    p.isExec = True
-    p.isInput = False
-    p.isOutput = True
-    p.connections = [c]
-    p.type = "exec"
-    p.PinName = "StartNode"
-    p.node = startNode
-    startNode.pins.append(p)
 
-    c = PinConnection()
-    c.PinId = "StartNode"
-    c.nodeName = "K2Node_Tunnel_0"
-    p = Pin()
-    p.PinId = "EndNode"
-    p.isExec = True
-    p.isInput = True
-    p.isOutput = False
-    p.connections = [c]
-    p.type = "exec"
-    p.PinName = "EndNode"
-    p.node = endNode
-    endNode.pins.append(p)
+#Multiple input execs entering a node, shared tails and loops
+tails = {} #node.Name pinId -> lambda name
+tailLabels = {} #node.Name pinId -> label name
+tailsByDominator : dict[str : List[PinConnection]] = {} #node.Name -> tail bodies to declare before the node's branches
+loopTails : dict[str : List[PinConnection]] = {} #node.Name -> tail bodies to declare inside the loop's body
+tailReturns : dict[str : List[str]] = {} #node.Name pinId -> label keys the tail's lambda returns the number of
+tailLabelsAdded = set()
+tailsAdded = set()
+startPhase("sharedTails")
+findSharedTails(startNode)
 
+startPhase("traversal")
+catchErrors = collectErrors
 stack = [startNode]
 connectionStack = [None]
+prefixStack = [""]
 endvar = "end" + getVarInc()
 
 while len(stack) > 0:
     current : Node = stack.pop()
     currentConnection : PinConnection = connectionStack.pop()
+    prefixCode : str = prefixStack.pop()
     if current.NodeComment.find("cpp:ignore") != -1:
         continue
+    activeTraceLevel = 2 if current.NodeComment.find("cpp:trace") != -1 else traceLevel
+    if activeTraceLevel > 0:
+        traceStart = time.perf_counter()
+
+    tailKey = ""
+    if currentConnection:
+        tailKey = currentConnection.nodeName + " " + currentConnection.PinId
+    if currentConnection and currentConnection.isTailBody:
+        mapFinds.clear() #Cached pointers may be stale when the lambda is called
+    elif (tailKey in tailLabels and currentConnection.isBackEdge) or tailKey in tails:
+        if prefixCode != "":
+            addCPP(prefixCode, "Add prefix code")
+            if prefixCode.find("{\n") != -1:
+                addTab()
+        addCPP(tabs() + currentConnection.jump + "\n", "Add goto" if currentConnection.isBackEdge else "Add tail call")
+        continue
+
+    #Branching nodes declare tails after their condition, other nodes before their code, e.g. outside of a for loop
+    branches = current.type == IfThen or current.type == Cast or current.type == Sequence or current.MacroGraph == "StandardMacros:IsValid"
+    if current.Name in tailsByDominator and not current.Name in tailsAdded and not branches:
+        tailsAdded.add(current.Name)
+        stack.append(current)
+        connectionStack.append(currentConnection)
+        prefixStack.append(prefixCode)
+        addTailsToStack(tailsByDominator[current.Name])
+        continue
     # if currentConnection: #Can be None from unindents and startNode
     #     branch = getBranch(currentConnection)
     #     if branch:
@@ -1740,186 +3516,173 @@ while len(stack) > 0:
     #             addBranchNodeAdded(currentConnection)
     #             addCPP(tabs() + branch + ":\n", "Add branch label")
 
-    if current.prefixCode != "":
-        addCPP(current.prefixCode, "Add prefix code")
-        if current.prefixCode.find("{\n") != -1:
+    if prefixCode != "":
+        addCPP(prefixCode, "Add prefix code")
+        if prefixCode.find("{\n") != -1:
             addTab()
 
-    #First node that starts a BP Macro
-    if current == startNode and (current.type == Tunnel or current.type == FunctionEntry):
-        if current.MemberName != "":
-            functionName = current.MemberName
-        if startNode.NodeComment != "":
-            functionName = startNode.NodeComment.split("\n")[0]
-
-        returnPins = []
-        if current.type == FunctionEntry:
-            for key, node in nodes.items():
-                if node.type == FunctionResult:
-                    for pin in node.pins:
-                        if not pin.isExec:
-                            returnPins.append(pin)
-                    break
-
-        if endNode:
-            for pin in endNode.pins:
-                if pin.isInput and not pin.isExec:
-                    returnPins.append(pin)
-
-        #Function declaration
-        line = tabs() + "void " + className + "::" + functionName + "("
-        suffix = ""
-        for pin in current.pins:
-            if pin.isOutput and not pin.isExec:
-                suffix += addOutPinToVariable(pin, [], cleanVar(pin.PinName))
-                if pin.isPointer:
-                    line += typ(pin) + cleanVar(pin.PinName) + ", "
-                else:
-                    line += "const " + typ(pin) + "& " + cleanVar(pin.PinName) + ", "
-        for pin in returnPins:
-            if pin.isPointer:
-                line += typ(pin) + cleanVar(pin.PinName) + ", "
-            else:
-                line += typ(pin) + "& " + cleanVar(pin.PinName) + ", "
-        line = noComma(line) + ") {\n"
-        addTab()
-
-        #Add local variable declarations
-        if current.type == FunctionEntry:
-            for pin in current.LocalVariables:
-                value = ["", pin.DefaultValue]
-                suffix += addOutPinToVariable(pin, value, cleanVar(pin.PinName))
-                line += tabs() + typ(pin) + cleanVar(pin.PinName) + " = " + pin.DefaultValue + ";\n"
-
-        addCPP(line + suffix, "Add function declaration")
-        out = current.getThenOutput()
-        if out:
-            addUnindentToStack() #Add } to very end of code
-            addNodeToStack(out.con())
-        else:
-            print("Could not find execute pin for start node! " + current.Name)
-    elif current.type == Unindent:
-        removeTab()
-        line = tabs() + "} " + current.postCode + "\n" #Post code may contain a skipping label
-        addCPP(line, "Add unindent")
-        if line.find("{\n") != -1:
-            addTab()
-    elif current.type == VariableSet:
-        #Resolve variable owner
-        selfPin = current.getSelfInput()
-        owner = ""
-        line = ""
-        if selfPin:
-            line += resolveReferences(selfPin)
-            owner = getInPinToVariable(selfPin) + "->"
-        setPin = current.variableSetPin()
-            
-        #Resolve value for setting
-        if current.selfIsContext():
-            owner = ""
-        if current.NodeComment.find("cpp:local") != -1:
-            owner = typ(setPin)
-        for pin in current.pins:
-            if pin.isInput and not pin.isExec and pin.connected():
-                line += resolveReferences(pin)
-        
-        if setPin.connected():
-            line += resolveReferences(setPin)
-            val = getInPinToVariable(setPin)
-            line += tabs() + owner + cleanVar(setPin.PinName) + " = " + val + ";\n"
-        else:
-            val = setPin.DefaultValue
-            if setPin.type != "FName" and setPin.type != "FString" and setPin.type != "FText" and setPin.DefaultValue == "":
-                val = "nullptr"
-            line += tabs() + owner + cleanVar(setPin.PinName) + " = " + val + ";\n"
-        addCPP(line, "Add variable set")
-        out = current.getThenOutput()
-        if out:
-            addNodeToStack(out.con())
-    elif current.type == Function:
-        line = getFunctionCode(current)
-        addCPP(line, "Add function call")
-        out = current.getThenOutput()
-        if out:
-            addNodeToStack(out.con())
-    elif current.type == Macro:
-        if current.MacroGraph == "StandardMacros:ForEachLoop":
-            usesIndex = False
-            usesElement = False
-            indexPin : Pin = None
-            elementPin : Pin = None
-            arrayPin : Pin = None
-            loopBodyPin : Pin = None
-            completedPin : Pin = None
-            for pin in current.pins:
-                if pin.PinName == "Array Index" and pin.connected():
-                    usesIndex = True
-                    indexPin = pin
-                elif pin.PinName == "Array Element" and pin.connected():
-                    usesElement = True
-                    elementPin = pin
-                elif pin.PinName == "Array" and pin.isInput:
-                    arrayPin = pin
-                elif pin.PinName == "LoopBody" and pin.isOutput:
-                    loopBodyPin = pin
-                elif pin.PinName == "Completed" and pin.isOutput:
-                    completedPin = pin
-                
-            line = resolveReferences(arrayPin)
+    if tailKey in tailLabels:
+        tailLabelsAdded.add(tailKey)
+        addCPP(tailLabels[tailKey] + ":\n", "Add label")
+
+    #Failing handlers are undone and replaced by a comment with collectErrors
+    cppLength = len(cpp)
+    tab = currentTab
+    stackLength = len(stack)
+    try:
+        #First node that starts a BP Macro
+        if current == startNode and (current.type == Tunnel or current.type == FunctionEntry):
+            if current.MemberName != "":
+                functionName = current.MemberName
+            if startNode.NodeComment != "":
+                functionName = startNode.NodeComment.split("\n")[0].split(":")[-1] #Library:MacroName
+
+            returnPins = []
+            if current.type == FunctionEntry:
+                for key, node in nodes.items():
+                    if node.type == FunctionResult:
+                        for pin in node.pins:
+                            if not pin.isExec:
+                                returnPins.append(pin)
+                        break
+
+            if endNode:
+                for pin in endNode.pins:
+                    if pin.isInput and not pin.isExec:
+                        returnPins.append(pin)
+
+            #Function declaration
+            line = tabs() + "void " + className + "::" + functionName + "("
             suffix = ""
-            arrayVar = getInPinToVariable(arrayPin)
+            for pin in current.pins:
+                if pin.isOutput and not pin.isExec:
+                    suffix += addOutPinToVariable(pin, [], cleanVar(pin.PinName))
+                    line += usePinType(pin).inParameter + cleanVar(pin.PinName) + ", "
+            for pin in returnPins:
+                line += usePinType(pin).outParameter + cleanVar(pin.PinName) + ", "
+            line = noComma(line) + ") {\n"
+            addTab()
 
-            if usesIndex and usesElement:
-                ivar = "i" + getVarInc()
-                suffix += addOutPinToVariable(indexPin, [], ivar)
-                line += tabs() + "for(int " + ivar + " = 0; " + ivar + " < " + arrayVar + ".Num(); ++" + ivar + ") {\n"
-                addTab()
-                value = [arrayVar, "[", ivar, "]"]
-                suffix += addOutPinToVariable(elementPin, value)
-                line += tabs() + typ(elementPin) + getOutPinToVariable(elementPin) + " = " + arrayToStr(value) + ";\n"
-            elif usesIndex:
-                ivar = "i" + getVarInc()
-                
-                suffix += addOutPinToVariable(indexPin, [], ivar)
-                line += tabs() + "for(int " + ivar + " = 0; " + ivar + " < " + arrayVar + ".Num(); ++" + ivar + ") {\n"
-                addTab()
-            elif usesElement:
-                suffix += addOutPinToVariable(elementPin, [])
-                line += tabs() + "for(auto& " + getOutPinToVariable(elementPin) + " : " + arrayVar + ") {\n"
+            #Add local variable declarations
+            if current.type == FunctionEntry:
+                for pin in current.LocalVariables:
+                    value = ["", pin.DefaultValue]
+                    suffix += addOutPinToVariable(pin, value, cleanVar(pin.PinName))
+                    line += tabs() + typ(pin) + cleanVar(pin.PinName) + " = " + pin.DefaultValue + ";\n"
+
+            addCPP(line + suffix, "Add function declaration")
+            out = current.getThenOutput()
+            if out:
+                addUnindentToStack() #Add } to very end of code
+                addNodeToStack(out.con())
+            else:
+                print("Could not find execute pin for start node! " + current.Name)
+        elif current.type == Unindent:
+            if current.preCode != "":
+                addCPP(tabs() + current.preCode + "\n", "Add unindent pre code")
+            removeTab()
+            if current.mapFinds != None:
+                mapFinds.clear()
+                mapFinds.update(current.mapFinds)
+            if current.postCode.startswith(";"): #End of a shared tail lambda
+                line = tabs() + "}" + current.postCode + "\n"
+            else:
+                line = tabs() + "} " + current.postCode + "\n" #Post code may contain a skipping label
+            addCPP(line, "Add unindent")
+            if line.find("{\n") != -1:
                 addTab()
-            addCPP(line + suffix, "Add for each loop macro")
-            if completedPin.connected():
-                addNodeToStack(completedPin.con())
-            addUnindentToStack()
-            if loopBodyPin.connected():
-                addNodeToStack(loopBodyPin.con())
-        elif current.MacroGraph == "StandardMacros:IsValid":
-            addCPP(addTwoPinBranch(current), "Add isValid macro")
-        elif current.MacroGraph == "StandardMacros:ForLoop":
-            firstPin = current.getPin("FirstIndex")
-            lastPin = current.getPin("LastIndex")
-            indexPin = current.getPin("Index")
+        elif current.type == VariableSet:
+            #Resolve variable owner
+            selfPin = current.getSelfInput()
+            owner = ""
             line = ""
-            suffix = ""
-            line += resolveReferences(firstPin)
-            line += resolveReferences(lastPin)
-            ivar = "i" + getVarInc()
+            if selfPin:
+                line += resolveReferences(selfPin)
+                owner = getInPinToVariable(selfPin) + "->"
+            setPin = current.variableSetPin()
             
-            suffix += addOutPinToVariable(indexPin, [], ivar)
-            line += f"{tabs()}for(int {ivar} = {getInPinToVariable(firstPin)}; {ivar} <= {getInPinToVariable(lastPin)}; ++{ivar}) {{\n"
-            addTab()
-            bodyPin = current.getPin("LoopBody")
-            completedPin = current.getPin("Completed")
-            if completedPin.connected():
-                addNodeToStack(completedPin.con())
-            addUnindentToStack()
-            if bodyPin.connected():
-                addNodeToStack(bodyPin.con())
-            addCPP(line + suffix, "Add for loop macro | Other pins")
-        elif current.MacroGraph == "StandardMacros:ForLoopWithBreak":
-            if currentConnection.PinId == current.getPin("Break").PinId:
-                addCPP(tabs() + getBreak(current) + " = false;\n", "Add for loop with break macro | Break pin")
+            #Resolve value for setting
+            if current.selfIsContext():
+                owner = ""
+            if current.NodeComment.find("cpp:local") != -1:
+                owner = typ(setPin)
+            for pin in current.pins:
+                if pin.isInput and not pin.isExec and pin.connected():
+                    line += resolveReferences(pin)
+        
+            if setPin.connected():
+                line += resolveReferences(setPin)
+                val = getInPinToVariable(setPin)
+                line += tabs() + owner + cleanVar(setPin.PinName) + " = " + val + ";\n"
             else:
+                val = setPin.DefaultValue
+                if setPin.type != "FName" and setPin.type != "FString" and setPin.type != "FText" and setPin.DefaultValue == "":
+                    val = "nullptr"
+                line += tabs() + owner + cleanVar(setPin.PinName) + " = " + val + ";\n"
+            addCPP(line, "Add variable set")
+            out = current.getThenOutput()
+            if out:
+                addNodeToStack(out.con())
+        elif current.type == Function:
+            line = getFunctionCode(current)
+            addCPP(line, "Add function call")
+            out = current.getThenOutput()
+            if out:
+                addNodeToStack(out.con())
+        elif current.type == Macro:
+            if current.MacroGraph == "StandardMacros:ForEachLoop":
+                usesIndex = False
+                usesElement = False
+                indexPin : Pin = None
+                elementPin : Pin = None
+                arrayPin : Pin = None
+                loopBodyPin : Pin = None
+                completedPin : Pin = None
+                for pin in current.pins:
+                    if pin.PinName == "Array Index" and pin.connected():
+                        usesIndex = True
+                        indexPin = pin
+                    elif pin.PinName == "Array Element" and pin.connected():
+                        usesElement = True
+                        elementPin = pin
+                    elif pin.PinName == "Array" and pin.isInput:
+                        arrayPin = pin
+                    elif pin.PinName == "LoopBody" and pin.isOutput:
+                        loopBodyPin = pin
+                    elif pin.PinName == "Completed" and pin.isOutput:
+                        completedPin = pin
+                
+                line = resolveReferences(arrayPin)
+                suffix = ""
+                arrayVar = getInPinToVariable(arrayPin)
+
+                if usesIndex and usesElement:
+                    ivar = "i" + getVarInc()
+                    suffix += addOutPinToVariable(indexPin, [], ivar)
+                    line += tabs() + "for(int " + ivar + " = 0; " + ivar + " < " + arrayVar + ".Num(); ++" + ivar + ") {\n"
+                    addTab()
+                    value = [arrayVar, "[", ivar, "]"]
+                    suffix += addOutPinToVariable(elementPin, value)
+                    line += tabs() + typ(elementPin) + getOutPinToVariable(elementPin) + " = " + arrayToStr(value) + ";\n"
+                elif usesIndex:
+                    ivar = "i" + getVarInc()
+                
+                    suffix += addOutPinToVariable(indexPin, [], ivar)
+                    line += tabs() + "for(int " + ivar + " = 0; " + ivar + " < " + arrayVar + ".Num(); ++" + ivar + ") {\n"
+                    addTab()
+                elif usesElement:
+                    suffix += addOutPinToVariable(elementPin, [])
+                    line += tabs() + "for(auto& " + getOutPinToVariable(elementPin) + " : " + arrayVar + ") {\n"
+                    addTab()
+                addCPP(line + suffix, "Add for each loop macro")
+                if completedPin.connected():
+                    addNodeToStack(completedPin.con())
+                addUnindentToStack()
+                if loopBodyPin.connected():
+                    addNodeToStack(loopBodyPin.con())
+            elif current.MacroGraph == "StandardMacros:IsValid":
+                addCPP(addTwoPinBranch(current), "Add isValid macro")
+            elif current.MacroGraph == "StandardMacros:ForLoop":
                 firstPin = current.getPin("FirstIndex")
                 lastPin = current.getPin("LastIndex")
                 indexPin = current.getPin("Index")
@@ -1927,12 +3690,10 @@ while len(stack) > 0:
                 suffix = ""
                 line += resolveReferences(firstPin)
                 line += resolveReferences(lastPin)
-                breakVar = addBreak(current)
                 ivar = "i" + getVarInc()
-                
+            
                 suffix += addOutPinToVariable(indexPin, [], ivar)
-                line += tabs() + "bool " + breakVar + " = true;\n"
-                line += tabs() + "for(int " + ivar + " = " + getInPinToVariable(firstPin) + "; " + ivar + " <= " + getInPinToVariable(lastPin) + " && " + breakVar + "; ++" + ivar + ") {\n"
+                line += f"{tabs()}for(int {ivar} = {getInPinToVariable(firstPin)}; {ivar} <= {getInPinToVariable(lastPin)}; ++{ivar}) {{\n"
                 addTab()
                 bodyPin = current.getPin("LoopBody")
                 completedPin = current.getPin("Completed")
@@ -1941,73 +3702,124 @@ while len(stack) > 0:
                 addUnindentToStack()
                 if bodyPin.connected():
                     addNodeToStack(bodyPin.con())
-                addCPP(line + suffix, "Add for loop with break macro | Other pins")
-        # elif current.MacroGraph in EasyMacroCalls:
+                addCPP(line + suffix, "Add for loop macro | Other pins")
+            elif current.MacroGraph == "StandardMacros:ForLoopWithBreak":
+                if currentConnection.PinId == current.getPin("Break").PinId:
+                    addCPP(tabs() + getBreak(current) + " = false;\n", "Add for loop with break macro | Break pin")
+                else:
+                    firstPin = current.getPin("FirstIndex")
+                    lastPin = current.getPin("LastIndex")
+                    indexPin = current.getPin("Index")
+                    line = ""
+                    suffix = ""
+                    line += resolveReferences(firstPin)
+                    line += resolveReferences(lastPin)
+                    breakVar = addBreak(current)
+                    ivar = "i" + getVarInc()
+                
+                    suffix += addOutPinToVariable(indexPin, [], ivar)
+                    line += tabs() + "bool " + breakVar + " = true;\n"
+                    line += tabs() + "for(int " + ivar + " = " + getInPinToVariable(firstPin) + "; " + ivar + " <= " + getInPinToVariable(lastPin) + " && " + breakVar + "; ++" + ivar + ") {\n"
+                    addTab()
+                    bodyPin = current.getPin("LoopBody")
+                    completedPin = current.getPin("Completed")
+                    if completedPin.connected():
+                        addNodeToStack(completedPin.con())
+                    addUnindentToStack()
+                    if bodyPin.connected():
+                        addNodeToStack(bodyPin.con())
+                    addCPP(line + suffix, "Add for loop with break macro | Other pins")
+            # elif current.MacroGraph in EasyMacroCalls:
+            else:
+                addCPP(easyMacroCall(current), "Easy macro call")
+            # else:
+                # error("Macro not yet implemented! " + current.Name + " | " + current.MacroGraph)
+        # elif current.type == ArrayFunction:
+        #     line = ""
+        #     if current.arrayFunctionType == ArraySet:
+        #         arrayPin = None
+        #         indexPin = None
+        #         itemPin = None
+        #         for pin in current.pins:
+        #             line += resolveReferences(pin)
+        #             if pin.PinName == "TargetArray":
+        #                 arrayPin = pin
+        #             if pin.PinName == "Index":
+        #                 indexPin = pin
+        #             if pin.PinName == "Item":
+        #                 itemPin = pin
+        #         if arrayPin == None or indexPin == None or itemPin == None:
+        #             error("Array/Index/Item Pin not found! " + current.Name)
+        #         line += tabs() + getInPinToVariable(arrayPin) + "[" + getInPinToVariable(indexPin) + "] = " + getInPinToVariable(itemPin) + ";\n"
+        #         addCPP(line, "Add array set function")
+        #     out = current.getThenOutput()
+        #     if out:
+        #         addNodeToStack(out.con())
+        elif current.type == Cast:
+            addCPP(addTwoPinBranch(current), "Add cast")
+        elif current.type == IfThen:
+            addCPP(addTwoPinBranch(current), "Add ifthen")
+        elif current.type == Sequence:
+            #This sequence check is unnecessary now that branches are removed
+            # sequenceVar = "sequence" + getVarInc() #Used to handle other outside execution pins entering a node thats connected to this sequence, generates a bool that doesn't allow that execution line to continue through to other sequence pins
+            # line = tabs() + "int " + sequenceVar + " = 0;\n"
+            inc = 0
+            for pin in current.pins:
+                if pin.isOutput and pin.connected():
+                    inc += 1
+            for pin in reversed(current.pins):
+                if pin.isOutput and pin.connected():
+                    inc -= 1
+                    # addUnindentToStack()
+                    # addNodeToStack(pin.con(), tabs() + "if(" + sequenceVar + " == " + str(inc) + ") {\n\t" + tabs() + "++" + sequenceVar + ";\n")
+                    addNodeToStack(pin.con())
+            # addCPP(line, "Add sequence")
+        elif current.type == Tunnel: #Output tunnel
+            line = ""
+            for pin in current.pins:
+                if pin.isInput and not pin.isExec:
+                    line += resolveReferences(pin)
+
+            for pin in current.pins:
+                if pin.isInput and not pin.isExec:
+                    line += tabs() + cleanVar(pin.PinName) + " = " + getInPinToVariable(pin) + ";\n"
+            addCPP(line, "Add tunnel")
+        elif current.type == Unsupported:
+            error("Unsupported node class! " + current.Class)
+        elif current.type == FunctionResult:
+            line = ""
+            for pin in current.pins:
+                if not pin.isExec:
+                    line += resolveReferences(pin)
+            for pin in current.pins:
+                if not pin.isExec:
+                    line += tabs() + cleanVar(pin.PinName) + " = " + getInPinToVariable(pin) + ";\n"
+            addCPP(line, "Add function result")
         else:
-            addCPP(easyMacroCall(current), "Easy macro call")
-        # else:
-            # error("Macro not yet implemented! " + current.Name + " | " + current.MacroGraph)
-    # elif current.type == ArrayFunction:
-    #     line = ""
-    #     if current.arrayFunctionType == ArraySet:
-    #         arrayPin = None
-    #         indexPin = None
-    #         itemPin = None
-    #         for pin in current.pins:
-    #             line += resolveReferences(pin)
-    #             if pin.PinName == "TargetArray":
-    #                 arrayPin = pin
-    #             if pin.PinName == "Index":
-    #                 indexPin = pin
-    #             if pin.PinName == "Item":
-    #                 itemPin = pin
-    #         if arrayPin == None or indexPin == None or itemPin == None:
-    #             error("Array/Index/Item Pin not found! " + current.Name)
-    #         line += tabs() + getInPinToVariable(arrayPin) + "[" + getInPinToVariable(indexPin) + "] = " + getInPinToVariable(itemPin) + ";\n"
-    #         addCPP(line, "Add array set function")
-    #     out = current.getThenOutput()
-    #     if out:
-    #         addNodeToStack(out.con())
-    elif current.type == Cast:
-        addCPP(addTwoPinBranch(current), "Add cast")
-    elif current.type == IfThen:
-        addCPP(addTwoPinBranch(current), "Add ifthen")
-    elif current.type == Sequence:
-        #This sequence check is unnecessary now that branches are removed
-        # sequenceVar = "sequence" + getVarInc() #Used to handle other outside execution pins entering a node thats connected to this sequence, generates a bool that doesn't allow that execution line to continue through to other sequence pins
-        # line = tabs() + "int " + sequenceVar + " = 0;\n"
-        inc = 0
-        for pin in current.pins:
-            if pin.isOutput and pin.connected():
-                inc += 1
-        for pin in reversed(current.pins):
-            if pin.isOutput and pin.connected():
-                inc -= 1
-                # addUnindentToStack()
-                # addNodeToStack(pin.con(), tabs() + "if(" + sequenceVar + " == " + str(inc) + ") {\n\t" + tabs() + "++" + sequenceVar + ";\n")
+            error("Unhandled node type for stack traversal! " + str(current.type))
+    except ConversionError as e:
+        cpp = cpp[:cppLength]
+        tracedLength = tracedLines = 0
+        del stack[stackLength:]
+        del connectionStack[stackLength:]
+        del prefixStack[stackLength:]
+        mapFinds.clear()
+        addCPP(skipNode(current, e, tab), "Skip node")
+        for pin in reversed(current.pins): #Keeps converting the nodes after it
+            if pin.isOutput and pin.isExec and pin.connected():
                 addNodeToStack(pin.con())
-        # addCPP(line, "Add sequence")
-    elif current.type == Tunnel: #Output tunnel
-        line = ""
-        for pin in current.pins:
-            if pin.isInput and not pin.isExec:
-                line += resolveReferences(pin)
-
-        for pin in current.pins:
-            if pin.isInput and not pin.isExec:
-                line += tabs() + cleanVar(pin.PinName) + " = " + getInPinToVariable(pin) + ";\n"
-        addCPP(line, "Add tunnel")
-    elif current.type == FunctionResult:
-        line = ""
-        for pin in current.pins:
-            if not pin.isExec:
-                line += resolveReferences(pin)
-        for pin in current.pins:
-            if not pin.isExec:
-                line += tabs() + cleanVar(pin.PinName) + " = " + getInPinToVariable(pin) + ";\n"
-        addCPP(line, "Add function result")
-    else:
-        error("Unhandled node type for stack traversal! " + str(current.type))
+
+    if branches and current.Name in tailsByDominator and not current.Name in tailsAdded:
+        tailsAdded.add(current.Name)
+        addTailsToStack(tailsByDominator[current.Name])
+    if current.Name in loopTails:
+        addTailsToStack(loopTails.pop(current.Name)) #Pushed after the loop body is indented
+
+    #Any impure node may add to a map and invalidate cached Find() pointers, branches keep them
+    if current.type == VariableSet or current.type == Function or current.type == Tunnel or current.type == FunctionResult or (current.type == Macro and current.MacroGraph != "StandardMacros:IsValid"):
+        mapFinds.clear()
+
+catchErrors = False
 
 removedVars = []
 
@@ -2065,6 +3877,7 @@ def findDoubles(var):
     if len(matches) == 2:
         removedVars.append(var)
                    
+startPhase("flatten")
 if flattenCode:
     for var, value in vars.items():
         findDoubles(var)
@@ -2078,23 +3891,35 @@ if flattenCode:
             replacement = resolveFlattenedVar(var)
             cpp = re.sub(reg, r"\1" + replacement + r"\2", cpp)
     
+startPhase("postReplacements")
 for key in postReplacements:
     cpp = cpp.replace(key, postReplacements[key])
 
-for key, value in postRegexReplacements.items():
-    cpp = re.sub(key, value, cpp)
-
-f = open("output.cpp", "w")
-f.write(cpp)
-f.close()
-
-pyperclip.copy(cpp)
-print("Output copied to clipboard")
-print("Output written to:")
-print(str(pathlib.Path().absolute()) + "\\output.cpp")
-
-k2Index = cpp.lower().find("k2")
-if k2Index != -1:
-    print("K2 found! " + cpp[k2Index : k2Index + 40 ])
+startPhase("postRegexReplacements")
+for pattern, replacement in regexReplacements:
+    cpp = pattern.sub(replacement, cpp)
+
+startPhase("output")
+includes = []
+if emitIncludes:
+    includes = getIncludes()
+fileCode = cpp
+if len(includes) > 0:
+    fileCode = "\n".join(includes) + "\n\n" + cpp
+writeOutput(fileCode if outputDir != "" else cpp)
+if outputDir == "" and len(includes) > 0:
+    print("Includes the code needs:")
+    print("\n".join(includes))
+
+if macroCacheDir != "":
+    if startNode.type == Tunnel and startNode.NodeComment != "":
+        macroPath = startNode.NodeComment.split("\n")[0]
+        if len(diagnostics) > 0:
+            print("Macro " + macroPath + " not cached, it has skipped nodes")
+        else:
+            storeMacro(macroPath, graphHash, functionName, fileCode)
+            print("Macro cached as " + macroPath + " in " + macroCacheDir)
+    for macroGraph in sorted(macroHelpersUsed):
+        print("Uses cached macro " + macroGraph + " -> " + findCachedMacro(macroGraph)["function"] + ", defined in " + os.path.join(macroCacheDir, "Macros.cpp"))
 
-writeToPersistent("currentVarInc=" + str(currentVarInc))
+finishRun()
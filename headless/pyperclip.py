@@ -0,0 +1,17 @@
+####################################################################################
+#Stand-in for pyperclip on machines without a clipboard, e.g. Linux CI
+#Put this directory first on PYTHONPATH:
+#BP_TO_CPP_CLIPBOARD -> file paste() returns, exported T3D text
+#BP_TO_CPP_CLIPBOARD_OUT -> file copy() writes to, optional
+####################################################################################
+import os
+
+def paste():
+    with open(os.environ["BP_TO_CPP_CLIPBOARD"], "r", newline="") as f: #Keeps the \r\n line endings of the editor's clipboard
+        return f.read()
+
+def copy(text):
+    path = os.environ.get("BP_TO_CPP_CLIPBOARD_OUT", "")
+    if path != "":
+        with open(path, "w", newline="") as f:
+            f.write(text)